@@ -186,6 +186,7 @@ def assemble(assembly_code):
         dr = 1
         cr = 2
 
+        abs = 7/15
         add = 5/7
         adi = 3/7
         bal = 7/10
@@ -195,8 +196,12 @@ def assemble(assembly_code):
         ble = 1/10
         blt = 3/11
         bne = 3/10
+        cat = 12/13
+        cel = 8/15
         cld = 5/11
         cls = 4/11
+        cmp = 1/14
+        cpy = 3/14
         del = 4/9
         den = 6/11
         dis = 2/11
@@ -204,25 +209,55 @@ def assemble(assembly_code):
         dup = 1/5
         ent = 1/2
         fdi = 4/7
+        fil = 5/14
+        flr = 11/15
         get = 10/11
+        gtd = 9/14
+        gti = 11/14
+        gtn = 13/14
+        has = 4/13
         hcf = 7/9
+        hep = 6/13
+        hpk = 9/13
+        hpp = 8/13
+        hps = 7/13
+        ins = 2/13
         inv = 5/6
         ldd = 1/7
         ldi = 0
         ldl = 1/11
         ldr = 7/11
         lds = 8/11
+        lkp = 3/13
+        map = 1/13
+        max = 13/15
+        min = 14/15
         mod = 2/9
         mul = 1/8
         mli = 1/4
         neg = 3/8
         new = 2/3
         num = 4/5
+        pof = 11/12
         pop = 2/7
+        pow = 1/16
+        psf = 7/12
         psh = 1/3
+        pti = 1/15
+        ptn = 2/15
+        pts = 4/15
         put = 9/11
+        pwm = 3/16
+        rem = 5/13
         ret = 8/9
+        sch = 11/13
+        seq = 5/16
+        sgn = 7/16
         siz = 3/4
+        sle = 9/16
+        slt = 11/16
+        sne = 13/16
+        srt = 10/13
         std = 3/5
         stl = 7/8
         str = 5/8
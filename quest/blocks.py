@@ -0,0 +1,232 @@
+from fractions import Fraction as Q
+from functools import partial
+
+from quest.opcode import Opcode
+from quest.operations import OPERATIONS
+from quest.register import Register
+from quest.utils import fraction_to_index
+
+IR = Register.IR.value
+DR = Register.DR.value
+CR = Register.CR.value
+
+
+def opcode_indices(*opcodes):
+    return {fraction_to_index(opcode.value) for opcode in opcodes}
+
+
+BAL_INDEX = fraction_to_index(Opcode.BAL.value)
+CLS_INDEX = fraction_to_index(Opcode.CLS.value)
+LDI_INDEX = fraction_to_index(Opcode.LDI.value)
+
+# Conditional branches and their conditions on the popped value
+CONDITIONS = {
+    fraction_to_index(Opcode.BEQ.value): lambda value: not value,
+    fraction_to_index(Opcode.BGE.value): lambda value: value >= 0,
+    fraction_to_index(Opcode.BGT.value): lambda value: value > 0,
+    fraction_to_index(Opcode.BLE.value): lambda value: value <= 0,
+    fraction_to_index(Opcode.BLT.value): lambda value: value < 0,
+    fraction_to_index(Opcode.BNE.value): lambda value: value,
+}
+
+# Instructions with a static target address
+BRANCH_INDICES = opcode_indices(
+    Opcode.BAL, Opcode.BEQ, Opcode.BGE, Opcode.BGT, Opcode.BLE, Opcode.BLT,
+    Opcode.BNE, Opcode.CLS)
+
+# Instructions that end a basic block
+TERMINATOR_INDICES = BRANCH_INDICES | opcode_indices(Opcode.CLD, Opcode.RET)
+
+# Instructions left to the interpreter: they block, halt, or read or write
+# the instruction register
+BARRIER_INDICES = opcode_indices(
+    Opcode.GET, Opcode.GTD, Opcode.GTI, Opcode.GTN, Opcode.HCF, Opcode.LDR,
+    Opcode.STR)
+
+# Instructions that can write to the stack holding the code
+WRITER_INDICES = opcode_indices(
+    Opcode.CAT, Opcode.CPY, Opcode.DEL, Opcode.FIL, Opcode.POF, Opcode.POP,
+    Opcode.PSF, Opcode.PSH, Opcode.SRT, Opcode.STD, Opcode.STL, Opcode.STS)
+
+# Instructions that record their own address as an allocation site
+ALLOCATOR_INDICES = opcode_indices(Opcode.HEP, Opcode.MAP, Opcode.NEW)
+
+INDEX_TO_OPERATION = {
+    fraction_to_index(opcode.value): operation
+    for opcode, operation in OPERATIONS.items()
+}
+
+
+class SelfModifyingCode(Exception):
+    pass
+
+
+class BlockEngine:
+    """Runs a process as basic blocks of closures with bound operands
+
+    Blocks start at the leaders found by scanning the code stack: the entry
+    point, static branch and call targets, and the instructions following
+    terminators and barriers. Addresses that are not leaders, such as
+    dynamic call targets that the scan did not see, are left to the
+    interpreter until execution reaches a leader again. The engine falls
+    back to the interpreter for good as soon as the code changes.
+    """
+
+    def __init__(self, process) -> None:
+        self.process = process
+        self.version = process.code_version
+        self.blocks = {}
+        self.leaders = self.find_leaders(process.registers[IR])
+
+    def find_leaders(self, entry: Q) -> set:
+        memory = self.process.memory
+        base = entry % 1
+        leaders = {entry}
+
+        for offset in range(memory.size(base)):
+            address = base + offset
+            index, _, operand = self.process.decode(address)
+
+            if index in BRANCH_INDICES:
+                leaders.add(operand)
+
+            if index in TERMINATOR_INDICES or index in BARRIER_INDICES:
+                leaders.add(address + 1)
+
+        return leaders
+
+    def compile(self, address: Q):
+        functions = []
+
+        while True:
+            index, operation, operand = self.process.decode(address)
+
+            if index in BARRIER_INDICES:
+                break
+
+            next_address = address + 1
+
+            if index in CONDITIONS:
+                functions.append(self.compile_branch(
+                    CONDITIONS[index], operand, next_address))
+                break
+            elif index == BAL_INDEX:
+                functions.append(self.compile_jump(operand))
+                break
+            elif index == CLS_INDEX:
+                functions.append(self.compile_call(operand, next_address))
+                break
+            elif index in TERMINATOR_INDICES:
+                functions.append(self.compile_terminator(
+                    operation, operand, next_address))
+                break
+            elif index == LDI_INDEX:
+                functions.append(self.compile_load_integer(operand))
+            elif index in ALLOCATOR_INDICES:
+                functions.append(self.compile_allocator(
+                    operation, operand, next_address))
+            elif index in WRITER_INDICES:
+                functions.append(self.compile_writer(
+                    operation, operand, next_address))
+            else:
+                functions.append(partial(operation, operand=operand))
+
+            address = next_address
+
+            if address in self.leaders:
+                break
+
+        if not functions:
+            return None
+
+        if index not in TERMINATOR_INDICES:
+            functions.append(self.compile_jump(address))
+
+        functions = tuple(functions)
+
+        def block(process):
+            for function in functions:
+                function(process)
+
+        return block
+
+    def compile_branch(self, condition, target: Q, next_address: Q):
+        def branch(process):
+            if condition(process.pop_data()):
+                process.registers[IR] = target
+            else:
+                process.registers[IR] = next_address
+
+        return branch
+
+    def compile_jump(self, target: Q):
+        def jump(process):
+            process.registers[IR] = target
+
+        return jump
+
+    def compile_call(self, target: Q, next_address: Q):
+        def call(process):
+            process.push_call(next_address)
+            process.registers[IR] = target
+
+        return call
+
+    def compile_terminator(self, operation, operand: int, next_address: Q):
+        def terminator(process):
+            process.registers[IR] = next_address
+            operation(process, operand)
+
+        return terminator
+
+    def compile_load_integer(self, value: Q):
+        def load_integer(process):
+            process.push_data(value)
+
+        return load_integer
+
+    def compile_allocator(self, operation, operand: int, next_address: Q):
+        def allocator(process):
+            # The operation takes the site from the instruction register
+            process.registers[IR] = next_address
+            operation(process, operand)
+
+        return allocator
+
+    def compile_writer(self, operation, operand: int, next_address: Q):
+        def writer(process):
+            operation(process, operand)
+
+            if process.code_version != self.version:
+                process.registers[IR] = next_address
+                raise SelfModifyingCode()
+
+        return writer
+
+    def run(self) -> None:
+        process = self.process
+        registers = process.registers
+        blocks = self.blocks
+        leaders = self.leaders
+
+        try:
+            while process.code_version == self.version:
+                address = registers[IR]
+                block = blocks.get(address)
+
+                if block is None:
+                    if address in leaders and address not in blocks:
+                        block = blocks[address] = self.compile(address)
+
+                    if block is None:
+                        if not process.step():
+                            return
+
+                        continue
+
+                block(process)
+        except SelfModifyingCode:
+            pass
+
+        while process.step():
+            pass
@@ -0,0 +1,282 @@
+from array import array
+import os
+import struct
+
+from quest.memory import Heap, Map, PAGE_SIZE, SparseStack
+from quest.numeric import BACKENDS
+
+MAGIC = b'QUEST'
+VERSION = 1
+
+# Value tags
+INT_TAG = 0
+RATIONAL_TAG = 1
+FLOAT_TAG = 2
+
+# Stack and page kinds
+NONE_KIND = 0
+ARRAY_KIND = 1
+LIST_KIND = 2
+SPARSE_KIND = 3
+MAP_KIND = 4
+HEAP_KIND = 5
+
+FLOAT = struct.Struct('<d')
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class Encoder:
+    """Writes checkpoint data
+
+    Unsigned integers are varints of seven bits per byte, low bits first.
+    Signed integers are zigzag encoded first. Rationals are a numerator
+    and a denominator.
+    """
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write_unsigned(self, value: int) -> None:
+        while value > 0x7f:
+            self.data.append(value & 0x7f | 0x80)
+            value >>= 7
+
+        self.data.append(value)
+
+    def write_signed(self, value: int) -> None:
+        self.write_unsigned(2 * value if value >= 0 else -2 * value - 1)
+
+    def write_string(self, value: str) -> None:
+        data = value.encode('utf-8')
+        self.write_unsigned(len(data))
+        self.data.extend(data)
+
+    def write_value(self, value) -> None:
+        if type(value) is int:
+            self.data.append(INT_TAG)
+            self.write_signed(value)
+        elif type(value) is float:
+            self.data.append(FLOAT_TAG)
+            self.data.extend(FLOAT.pack(value))
+        else:
+            self.data.append(RATIONAL_TAG)
+            self.write_signed(int(value.numerator))
+            self.write_unsigned(int(value.denominator))
+
+    def write_values(self, values) -> None:
+        self.write_unsigned(len(values))
+
+        for value in values:
+            self.write_value(value)
+
+    def write_ints(self, values) -> None:
+        self.write_unsigned(len(values))
+
+        for value in values:
+            self.write_signed(value)
+
+    def write_stack(self, stack) -> None:
+        if stack is None:
+            self.data.append(NONE_KIND)
+        elif type(stack) is array:
+            self.data.append(ARRAY_KIND)
+            self.write_ints(stack)
+        elif type(stack) is Map:
+            self.data.append(MAP_KIND)
+            self.write_unsigned(len(stack))
+
+            for key, value in stack.items():
+                self.write_value(key)
+                self.write_value(value)
+        elif type(stack) is Heap:
+            self.data.append(HEAP_KIND)
+            self.write_unsigned(len(stack))
+
+            for priority, value in stack:
+                self.write_value(priority)
+                self.write_value(value)
+        elif type(stack) is SparseStack:
+            self.data.append(SPARSE_KIND)
+            self.write_unsigned(stack.size)
+            self.write_unsigned(len(stack.pages))
+
+            for key, page in sorted(stack.pages.items()):
+                self.write_unsigned(key)
+                self.write_stack(page)
+        else:
+            self.data.append(LIST_KIND)
+            self.write_values(stack)
+
+
+class Decoder:
+    def __init__(self, data: bytes, rational) -> None:
+        self.data = data
+        self.position = 0
+        self.rational = rational
+
+    def read_byte(self) -> int:
+        if self.position >= len(self.data):
+            raise CheckpointError('Truncated checkpoint')
+
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def read_unsigned(self) -> int:
+        value = 0
+        shift = 0
+
+        while True:
+            byte = self.read_byte()
+            value |= (byte & 0x7f) << shift
+            shift += 7
+
+            if byte < 0x80:
+                return value
+
+    def read_signed(self) -> int:
+        value = self.read_unsigned()
+        return value // 2 if not value & 1 else -(value + 1) // 2
+
+    def read_string(self) -> str:
+        size = self.read_unsigned()
+        data = self.data[self.position:self.position + size]
+        self.position += size
+        return bytes(data).decode('utf-8')
+
+    def read_value(self):
+        tag = self.read_byte()
+
+        if tag == INT_TAG:
+            return self.read_signed()
+
+        if tag == FLOAT_TAG:
+            value, = FLOAT.unpack_from(self.data, self.position)
+            self.position += FLOAT.size
+            return value
+
+        if tag == RATIONAL_TAG:
+            numerator = self.read_signed()
+            denominator = self.read_unsigned()
+            return self.rational(numerator, denominator)
+
+        raise CheckpointError(f'Invalid value tag: {tag}')
+
+    def read_values(self) -> list:
+        return [self.read_value() for _ in range(self.read_unsigned())]
+
+    def read_ints(self) -> array:
+        return array(
+            'q', [self.read_signed() for _ in range(self.read_unsigned())])
+
+    def read_stack(self):
+        kind = self.read_byte()
+
+        if kind == NONE_KIND:
+            return None
+
+        if kind == ARRAY_KIND:
+            return self.read_ints()
+
+        if kind == LIST_KIND:
+            return self.read_values()
+
+        if kind == MAP_KIND:
+            return Map(
+                (self.read_value(), self.read_value())
+                for _ in range(self.read_unsigned()))
+
+        if kind == HEAP_KIND:
+            # Pairs are written in heap order
+            return Heap(
+                (self.read_value(), self.read_value())
+                for _ in range(self.read_unsigned()))
+
+        if kind == SPARSE_KIND:
+            stack = SparseStack(self.read_unsigned())
+
+            for _ in range(self.read_unsigned()):
+                key = self.read_unsigned()
+                page = self.read_stack()
+
+                if len(page) != PAGE_SIZE:
+                    raise CheckpointError('Invalid page size')
+
+                stack.pages[key] = page
+
+            return stack
+
+        raise CheckpointError(f'Invalid stack kind: {kind}')
+
+
+def save(process, path: str) -> None:
+    memory = process.memory
+    encoder = Encoder()
+
+    encoder.data.extend(MAGIC)
+    encoder.write_unsigned(VERSION)
+    encoder.write_string(process.numeric)
+    encoder.write_unsigned(process.exact)
+    encoder.write_values(process.registers)
+
+    encoder.write_unsigned(memory.next_index)
+    encoder.write_ints(memory.free)
+    encoder.write_unsigned(len(memory.stacks))
+
+    for stack in memory.stacks:
+        encoder.write_stack(stack)
+
+    encoder.write_unsigned(len(process.streams))
+
+    for stream in process.streams:
+        encoder.write_values(stream)
+
+    # Replace the previous checkpoint only once the new one is complete
+    temporary_path = path + '.tmp'
+
+    with open(temporary_path, 'wb') as file:
+        file.write(encoder.data)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary_path, path)
+
+
+def load(path: str) -> dict:
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if not data.startswith(MAGIC):
+        raise CheckpointError(f'Not a checkpoint: {path}')
+
+    decoder = Decoder(data, None)
+    decoder.position = len(MAGIC)
+    version = decoder.read_unsigned()
+
+    if version != VERSION:
+        raise CheckpointError(f'Unsupported checkpoint version: {version}')
+
+    numeric = decoder.read_string()
+
+    if numeric not in BACKENDS:
+        raise CheckpointError(f'Unavailable numeric backend: {numeric}')
+
+    decoder.rational = BACKENDS[numeric]
+    exact = bool(decoder.read_unsigned())
+    registers = decoder.read_values()
+
+    next_index = decoder.read_unsigned()
+    free = list(decoder.read_ints())
+    stacks = [decoder.read_stack() for _ in range(decoder.read_unsigned())]
+    streams = [decoder.read_values() for _ in range(decoder.read_unsigned())]
+
+    return {
+        'numeric': numeric,
+        'exact': exact,
+        'registers': registers,
+        'memory': (stacks, free, next_index),
+        'streams': streams,
+    }
@@ -0,0 +1,737 @@
+from fractions import Fraction as Q
+
+from quest.opcode import Opcode
+from quest.register import Register
+from quest.utils import fraction_to_index, normalize
+
+IR = Register.IR.value
+DR = Register.DR.value
+CR = Register.CR.value
+
+INDEX_TO_OPCODE = {
+    fraction_to_index(opcode.value): opcode for opcode in Opcode
+}
+
+# Instructions with a static target address
+BRANCH_OPCODES = {
+    Opcode.BAL, Opcode.BEQ, Opcode.BGE, Opcode.BGT, Opcode.BLE, Opcode.BLT,
+    Opcode.BNE, Opcode.CLS,
+}
+
+# Instructions that end a basic block
+TERMINATOR_OPCODES = BRANCH_OPCODES | {Opcode.CLD, Opcode.HCF, Opcode.RET}
+
+# Conditional branches and the Python condition on the popped value
+CONDITIONS = {
+    Opcode.BEQ: 'not {}',
+    Opcode.BGE: '{} >= 0',
+    Opcode.BGT: '{} > 0',
+    Opcode.BLE: '{} <= 0',
+    Opcode.BLT: '{} < 0',
+    Opcode.BNE: '{}',
+}
+
+BINARY_OPERATORS = {
+    Opcode.ADD: '+',
+    Opcode.MOD: '%',
+    Opcode.MUL: '*',
+    Opcode.SUB: '-',
+}
+
+MODULE_HEADER = '''\
+# Generated by questc. Do not edit.
+
+from fractions import Fraction as Q
+from math import ceil, floor
+import sys
+
+from quest.numeric import power, power_modulo
+from quest.process import Process
+from quest.stdio import (
+    has_integer, read_integer, read_until, read_values, write_number)
+from quest.utils import normalize
+
+IR = {ir}
+DR = {dr}
+CR = {cr}
+'''
+
+MODULE_FOOTER = '''
+
+def run(process):
+    if not process.exact:
+        process.run()
+        return
+
+    registers = process.registers
+    process.watch_code(registers[IR])
+    version = process.code_version
+
+    while process.code_version == version:
+        block = BLOCK_IDS.get(registers[IR])
+
+        while block is not None:
+            block = BLOCKS[block](process, version)
+
+        if not process.step():
+            return
+
+    while process.step():
+        pass
+
+
+def main():
+    process = Process(MACHINE_CODE, sys.argv[1:])
+
+    if not sys.stdin.isatty():
+        process.write(sys.stdin.read())
+
+    run(process)
+    print(process.read(), end='')
+
+
+if __name__ == '__main__':
+    main()
+'''
+
+
+def decode(machine_code: list) -> list:
+    instructions = []
+
+    for instruction in machine_code:
+        operand, opcode = divmod(Q(instruction), 1)
+        opcode = INDEX_TO_OPCODE.get(fraction_to_index(opcode))
+        instructions.append((opcode, operand))
+
+    return instructions
+
+
+def find_leaders(instructions: list) -> list:
+    leaders = {0}
+
+    for offset, (opcode, operand) in enumerate(instructions):
+        if opcode in BRANCH_OPCODES and 0 <= operand < len(instructions):
+            leaders.add(operand)
+
+        if opcode in TERMINATOR_OPCODES or (
+                opcode is Opcode.STR and operand == IR):
+            leaders.add(offset + 1)
+
+    return sorted(leader for leader in leaders if leader < len(instructions))
+
+
+def constant(value: int) -> str:
+    return str(value) if value >= 0 else f'({value})'
+
+
+class BlockCompiler:
+    """Compiles one basic block to a Python function
+
+    The top of the data stack is kept in local variables while the block
+    runs, and only written back to memory when the block exits or before
+    an instruction that could observe the data stack through memory.
+    """
+
+    def __init__(self, module, block_id: int, start: int, end: int) -> None:
+        self.module = module
+        self.block_id = block_id
+        self.start = start
+        self.end = end
+        self.lines = []
+        self.stack = []
+        self.local_count = 0
+
+    def emit(self, line: str) -> None:
+        self.lines.append('    ' + line)
+
+    def new_local(self) -> str:
+        name = f'v{self.local_count}'
+        self.local_count += 1
+        return name
+
+    def push_value(self, expression: str) -> None:
+        name = self.new_local()
+        self.emit(f'{name} = {expression}')
+        self.stack.append(name)
+
+    def pop_value(self) -> str:
+        if self.stack:
+            return self.stack.pop()
+
+        name = self.new_local()
+        self.emit(f'{name} = process.pop_data()')
+        return name
+
+    def flush(self) -> None:
+        for value in self.stack:
+            self.emit(f'process.push_data({value})')
+
+        self.stack = []
+
+    def exit_to(self, target: int, indent: str = '') -> None:
+        # Continue with the block starting at target, or with the
+        # interpreter if there is none
+        self.emit(f'{indent}registers[IR] = {constant(target)}')
+        self.emit(f'{indent}return {self.module.block_ids.get(target)}')
+
+    def exit_dynamic(self, address: str) -> None:
+        self.emit(f'registers[IR] = {address}')
+        self.emit(f'return BLOCK_IDS.get({address})')
+
+    def exit_to_interpreter(self, address: int, indent: str = '') -> None:
+        # Leave the instruction at address to the interpreter
+        self.emit(f'{indent}registers[IR] = {constant(address)}')
+        self.emit(f'{indent}return None')
+
+    def exit_if(self, condition: str, address: int) -> None:
+        self.emit(f'if {condition}:')
+
+        for value in self.stack:
+            self.emit(f'    process.push_data({value})')
+
+        self.exit_to_interpreter(address, '    ')
+
+    def check_code_version(self, next_address: int) -> None:
+        self.exit_if('process.code_version != version', next_address)
+
+    def compile(self) -> list:
+        for offset in range(self.start, self.end):
+            opcode, operand = self.module.instructions[offset]
+
+            if opcode is None:
+                self.flush()
+                self.exit_to_interpreter(offset)
+                break
+
+            method = getattr(self, 'compile_' + opcode.name.lower())
+
+            if method(offset, operand) is False:
+                break
+        else:
+            self.flush()
+            self.exit_to(self.end)
+
+        return [
+            f'def block_{self.block_id}(process, version):',
+            '    registers = process.registers',
+            '    locations = process.locations',
+            '    memory = process.memory',
+            '    streams = process.streams',
+        ] + self.lines
+
+    def compile_binary(self, opcode: Opcode) -> None:
+        right = self.pop_value()
+        left = self.pop_value()
+        self.push_value(
+            f'normalize({left} {BINARY_OPERATORS[opcode]} {right})')
+
+    def compile_abs(self, offset: int, operand: int) -> None:
+        self.push_value(f'abs({self.pop_value()})')
+
+    def compile_add(self, offset: int, operand: int) -> None:
+        self.compile_binary(Opcode.ADD)
+
+    def compile_adi(self, offset: int, operand: int) -> None:
+        self.push_value(f'{self.pop_value()} + {operand}')
+
+    def compile_branch(self, offset: int, operand: int, opcode: Opcode):
+        value = self.pop_value()
+        self.flush()
+        self.emit(f'if {CONDITIONS[opcode].format(value)}:')
+        self.exit_to(operand, '    ')
+        self.exit_to(offset + 1)
+        return False
+
+    def compile_bal(self, offset: int, operand: int) -> bool:
+        self.flush()
+        self.exit_to(operand)
+        return False
+
+    def compile_beq(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BEQ)
+
+    def compile_bge(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BGE)
+
+    def compile_bgt(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BGT)
+
+    def compile_ble(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BLE)
+
+    def compile_blt(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BLT)
+
+    def compile_bne(self, offset: int, operand: int) -> bool:
+        return self.compile_branch(offset, operand, Opcode.BNE)
+
+    def compile_cat(self, offset: int, operand: int) -> None:
+        source = self.pop_value()
+        target = self.pop_value()
+        self.flush()
+        self.emit(f'memory.concatenate({target}, {source})')
+        self.check_code_version(offset + 1)
+
+    def compile_cel(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize(ceil({self.pop_value()}))')
+
+    def compile_cld(self, offset: int, operand: int) -> bool:
+        function = self.pop_value()
+        self.flush()
+        self.emit(f'process.push_call({constant(offset + 1)})')
+        self.exit_dynamic(function)
+        return False
+
+    def compile_cls(self, offset: int, operand: int) -> bool:
+        self.flush()
+        self.emit(f'process.push_call({constant(offset + 1)})')
+        self.exit_to(operand)
+        return False
+
+    def compile_cmp(self, offset: int, operand: int) -> None:
+        count = self.pop_value()
+        right = self.pop_value()
+        left = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.compare({left}, {right}, {count})')
+
+    def compile_cpy(self, offset: int, operand: int) -> None:
+        count = self.pop_value()
+        target = self.pop_value()
+        source = self.pop_value()
+        self.flush()
+        self.emit(f'memory.copy_range({source}, {target}, {count})')
+        self.check_code_version(offset + 1)
+
+    def compile_del(self, offset: int, operand: int) -> None:
+        array = self.pop_value()
+        self.flush()
+        self.emit(f'memory.delete({array})')
+        self.check_code_version(offset + 1)
+
+    def compile_den(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize(({self.pop_value()}).denominator)')
+
+    def compile_dis(self, offset: int, operand: int) -> None:
+        if self.stack:
+            self.stack.pop()
+        else:
+            self.emit('process.pop_data()')
+
+    def compile_div(self, offset: int, operand: int) -> None:
+        right = self.pop_value()
+        left = self.pop_value()
+        self.push_value(f'normalize(process.rational({left}, {right}))')
+
+    def compile_dup(self, offset: int, operand: int) -> None:
+        if operand < len(self.stack):
+            self.stack.append(self.stack[-1 - operand])
+        else:
+            self.flush()
+            self.push_value(f'memory.load(locations[DR], {-1 - operand})')
+
+    def compile_ent(self, offset: int, operand: int) -> None:
+        for _ in range(operand):
+            self.emit(f'process.push_call({constant(0)})')
+
+    def compile_fdi(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize({self.pop_value()} // {operand})')
+
+    def compile_fil(self, offset: int, operand: int) -> None:
+        count = self.pop_value()
+        address = self.pop_value()
+        value = self.pop_value()
+        self.flush()
+        self.emit(f'memory.fill({address}, {value}, {count})')
+        self.check_code_version(offset + 1)
+
+    def compile_flr(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize(floor({self.pop_value()}))')
+
+    def compile_get(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        stream = self.new_local()
+        self.emit(f'{stream} = streams[floor({handle})]')
+        self.stack.append(handle)
+        self.exit_if(f'not {stream}', offset)
+        self.stack.pop()
+        self.push_value(f'{stream}.popleft()')
+
+    def compile_get_values(
+            self, offset: int, function: str, waiting: str) -> None:
+        handle = self.pop_value()
+        argument = self.pop_value()
+        base = self.pop_value()
+        stream = self.new_local()
+        self.emit(f'{stream} = streams[floor({handle})]')
+        self.stack.extend([base, argument, handle])
+        self.exit_if(waiting.format(stream=stream, argument=argument), offset)
+        del self.stack[-3:]
+        values = self.new_local()
+        self.flush()
+        self.emit(f'{values} = {function}({stream}, {argument})')
+
+        self.emit(f'memory.extend({base}, {values})')
+        self.push_value(f'len({values})')
+        self.check_code_version(offset + 1)
+
+    def compile_gtd(self, offset: int, operand: int) -> None:
+        self.compile_get_values(
+            offset, 'read_until', '{argument} not in {stream}')
+
+    def compile_gti(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        stream = self.new_local()
+        self.emit(f'{stream} = streams[floor({handle})]')
+        self.stack.append(handle)
+        self.exit_if(f'not has_integer({stream})', offset)
+        self.stack.pop()
+        self.push_value(f'read_integer({stream})')
+
+    def compile_gtn(self, offset: int, operand: int) -> None:
+        self.compile_get_values(
+            offset, 'read_values', 'len({stream}) < {argument}')
+
+    def compile_has(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        key = self.pop_value()
+        self.flush()
+        self.push_value(f'int(memory.map_contains({handle}, {key}))')
+
+    def compile_hcf(self, offset: int, operand: int) -> bool:
+        self.flush()
+        self.exit_to_interpreter(offset)
+        return False
+
+    def compile_hep(self, offset: int, operand: int) -> None:
+        # The garbage collector only sees values in memory
+        self.flush()
+        self.push_value(f'memory.new_heap({offset})')
+
+    def compile_heap_read(self, function: str) -> None:
+        handle = self.pop_value()
+        self.flush()
+        priority = self.new_local()
+        value = self.new_local()
+        self.emit(f'{priority}, {value} = memory.{function}({handle})')
+        self.stack.append(value)
+        self.stack.append(priority)
+
+    def compile_hpk(self, offset: int, operand: int) -> None:
+        self.compile_heap_read('heap_peek')
+
+    def compile_hpp(self, offset: int, operand: int) -> None:
+        self.compile_heap_read('heap_pop')
+
+    def compile_hps(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        priority = self.pop_value()
+        value = self.pop_value()
+        self.emit(f'memory.heap_push({handle}, {priority}, {value})')
+
+    def compile_ins(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        key = self.pop_value()
+        value = self.pop_value()
+        self.emit(f'memory.map_insert({handle}, {key}, {value})')
+
+    def compile_inv(self, offset: int, operand: int) -> None:
+        self.push_value(
+            f'normalize(process.rational(1, {self.pop_value()}))')
+
+    def compile_ldd(self, offset: int, operand: int) -> None:
+        address = self.pop_value()
+        self.flush()
+        self.push_value(
+            f'memory.load(memory.locate({address}), {operand})')
+
+    def compile_ldi(self, offset: int, operand: int) -> None:
+        self.stack.append(constant(operand))
+
+    def compile_ldl(self, offset: int, operand: int) -> None:
+        self.push_value(f'memory.load(locations[CR], {-1 - operand})')
+
+    def compile_ldr(self, offset: int, operand: int) -> None:
+        if operand == IR:
+            self.stack.append(constant(offset + 1))
+        else:
+            self.push_value(f'registers[{operand}]')
+
+    def compile_lds(self, offset: int, operand: int) -> None:
+        self.push_value(f'memory[{constant(operand)}]')
+
+    def compile_lkp(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        key = self.pop_value()
+        default = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.map_lookup({handle}, {key}, {default})')
+
+    def compile_map(self, offset: int, operand: int) -> None:
+        # The garbage collector only sees values in memory
+        self.flush()
+        self.push_value(f'memory.new_map({offset})')
+
+    def compile_max(self, offset: int, operand: int) -> None:
+        right = self.pop_value()
+        left = self.pop_value()
+        self.push_value(f'max({left}, {right})')
+
+    def compile_min(self, offset: int, operand: int) -> None:
+        right = self.pop_value()
+        left = self.pop_value()
+        self.push_value(f'min({left}, {right})')
+
+    def compile_mli(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize({self.pop_value()} * {operand})')
+
+    def compile_mod(self, offset: int, operand: int) -> None:
+        self.compile_binary(Opcode.MOD)
+
+    def compile_mul(self, offset: int, operand: int) -> None:
+        self.compile_binary(Opcode.MUL)
+
+    def compile_neg(self, offset: int, operand: int) -> None:
+        self.push_value(f'-{self.pop_value()}')
+
+    def compile_new(self, offset: int, operand: int) -> None:
+        # The garbage collector only sees values in memory
+        self.flush()
+        self.push_value(f'memory.new({operand}, {offset})')
+
+    def compile_num(self, offset: int, operand: int) -> None:
+        self.push_value(f'normalize(({self.pop_value()}).numerator)')
+
+    def compile_pop(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.pop({handle})')
+        self.check_code_version(offset + 1)
+
+    def compile_pof(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.pop_front({handle})')
+        self.check_code_version(offset + 1)
+
+    def compile_pow(self, offset: int, operand: int) -> None:
+        exponent = self.pop_value()
+        base = self.pop_value()
+
+        self.push_value(
+            f'normalize(power({base}, {exponent}, process.rational))')
+
+    def compile_psf(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        value = self.pop_value()
+        self.flush()
+        self.emit(f'memory.push_front({handle}, {value})')
+        self.check_code_version(offset + 1)
+
+    def compile_psh(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        value = self.pop_value()
+        self.flush()
+        self.emit(f'memory.push({handle}, {value})')
+        self.check_code_version(offset + 1)
+
+    def compile_pti(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        value = self.pop_value()
+        self.emit(f'write_number(streams[floor({handle})], {value})')
+
+    def compile_ptn(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        count = self.pop_value()
+        address = self.pop_value()
+        self.flush()
+
+        self.emit(
+            f'streams[floor({handle})].extend('
+            f'memory.read_slice({address}, {count}))')
+
+    def compile_pts(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        base = self.pop_value()
+        self.flush()
+
+        self.emit(
+            f'streams[floor({handle})].extend('
+            f'memory.read_slice({base}, memory.size({base})))')
+
+    def compile_put(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        value = self.pop_value()
+        self.emit(f'streams[floor({handle})].append({value})')
+
+    def compile_pwm(self, offset: int, operand: int) -> None:
+        modulus = self.pop_value()
+        exponent = self.pop_value()
+        base = self.pop_value()
+        self.push_value(
+            f'normalize(power_modulo({base}, {exponent}, {modulus}))')
+
+    def compile_rem(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        key = self.pop_value()
+        self.emit(f'memory.map_remove({handle}, {key})')
+
+    def compile_ret(self, offset: int, operand: int) -> bool:
+        self.flush()
+
+        for _ in range(operand):
+            self.emit('process.pop_call()')
+
+        address = self.new_local()
+        self.emit(f'{address} = process.pop_call()')
+        self.exit_dynamic(address)
+        return False
+
+    def compile_sch(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        value = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.search({handle}, {value}, {operand or 1})')
+
+    def compile_comparison(self, operator: str) -> None:
+        right = self.pop_value()
+        left = self.pop_value()
+        self.push_value(f'int({left} {operator} {right})')
+
+    def compile_seq(self, offset: int, operand: int) -> None:
+        self.compile_comparison('==')
+
+    def compile_sgn(self, offset: int, operand: int) -> None:
+        value = self.pop_value()
+        self.push_value(f'({value} > 0) - ({value} < 0)')
+
+    def compile_siz(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        self.flush()
+        self.push_value(f'memory.size({handle})')
+
+    def compile_sle(self, offset: int, operand: int) -> None:
+        self.compile_comparison('<=')
+
+    def compile_slt(self, offset: int, operand: int) -> None:
+        self.compile_comparison('<')
+
+    def compile_sne(self, offset: int, operand: int) -> None:
+        self.compile_comparison('!=')
+
+    def compile_srt(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        self.flush()
+        self.emit(f'memory.sort({handle}, {operand or 1})')
+        self.check_code_version(offset + 1)
+
+    def compile_std(self, offset: int, operand: int) -> None:
+        address = self.pop_value()
+        value = self.pop_value()
+        self.flush()
+        self.emit(
+            f'memory.store(memory.locate({address}), {operand}, {value})')
+        self.check_code_version(offset + 1)
+
+    def compile_stl(self, offset: int, operand: int) -> None:
+        value = self.pop_value()
+        self.emit(
+            f'memory.store(locations[CR], {-1 - operand}, {value})')
+        self.check_code_version(offset + 1)
+
+    def compile_str(self, offset: int, operand: int):
+        value = self.pop_value()
+        self.flush()
+
+        if operand == IR:
+            self.exit_dynamic(value)
+            return False
+
+        self.emit(f'process.set_register({operand}, {value})')
+
+    def compile_sts(self, offset: int, operand: int) -> None:
+        value = self.pop_value()
+        self.emit(f'memory[{constant(operand)}] = {value}')
+        self.check_code_version(offset + 1)
+
+    def compile_sub(self, offset: int, operand: int) -> None:
+        self.compile_binary(Opcode.SUB)
+
+    def compile_swp(self, offset: int, operand: int) -> None:
+        a = self.pop_value()
+        b = self.pop_value()
+        self.stack.append(a)
+        self.stack.append(b)
+
+    def compile_tel(self, offset: int, operand: int) -> None:
+        handle = self.pop_value()
+        self.push_value(f'len(streams[floor({handle})])')
+
+
+class ModuleCompiler:
+    """Compiles machine code to the source code of a Python module
+
+    The module runs a process created from its MACHINE_CODE with the code
+    stack at base zero, as the assembler assumes. Each basic block becomes
+    a function that returns the id of the next block, and run() dispatches
+    between them. Instructions that the blocks do not cover are left to
+    the interpreter, which takes over for good if the code changes.
+    """
+
+    def __init__(self, machine_code: list) -> None:
+        self.machine_code = [
+            normalize(Q(instruction)) for instruction in machine_code
+        ]
+        self.instructions = decode(self.machine_code)
+        self.leaders = find_leaders(self.instructions)
+        self.block_ids = {
+            leader: block_id for block_id, leader in enumerate(self.leaders)
+        }
+
+    def compile(self) -> str:
+        blocks = []
+        ends = self.leaders[1:] + [len(self.instructions)]
+
+        for block_id, (start, end) in enumerate(zip(self.leaders, ends)):
+            compiler = BlockCompiler(self, block_id, start, end)
+            blocks.append('\n'.join(compiler.compile()))
+
+        lines = [MODULE_HEADER.format(ir=IR, dr=DR, cr=CR)]
+        lines.append('MACHINE_CODE = [')
+
+        for instruction in self.machine_code:
+            if type(instruction) is int:
+                lines.append(f'    {instruction},')
+            else:
+                lines.append(
+                    f'    Q({instruction.numerator}, '
+                    f'{instruction.denominator}),')
+
+        lines.append(']')
+        lines.append('')
+
+        for block in blocks:
+            lines.append('')
+            lines.append('')
+            lines.append(block)
+
+        lines.append('')
+        lines.append('')
+        lines.append('BLOCKS = [')
+
+        for block_id in range(len(self.leaders)):
+            lines.append(f'    block_{block_id},')
+
+        lines.append(']')
+        lines.append('')
+        lines.append('BLOCK_IDS = {')
+
+        for block_id, leader in enumerate(self.leaders):
+            lines.append(f'    {leader}: {block_id},')
+
+        lines.append('}')
+        return '\n'.join(lines) + MODULE_FOOTER
+
+
+def compile_module(machine_code: list) -> str:
+    return ModuleCompiler(machine_code).compile()
@@ -0,0 +1,91 @@
+from quest.memory import Heap, Map, SparseStack
+from quest.numeric import exact
+
+# Allocations between collections
+COLLECTION_INTERVAL = 100000
+
+# Number of stack indices in use before the first collection
+INITIAL_LIMIT = 1024
+
+
+class GarbageCollector:
+    """Frees the stacks that a process can no longer reach
+
+    The roots are the registers, which hold the code, data and call stacks,
+    and the values in the streams. Containers such as maps and heaps count as
+    stacks.
+    Any value whose fractional part is the base of a live stack is taken to
+    refer to that stack, so the collector is conservative: it never frees a
+    reachable stack, but a number that happens to look like a base keeps a
+    stack alive.
+
+    A collection runs before an allocation, after COLLECTION_INTERVAL
+    allocations, or when the allocation would grow the stack table past a
+    limit. The limit is raised to twice the number of live stacks after
+    each collection.
+    """
+
+    def __init__(
+            self, process, interval: int = COLLECTION_INTERVAL,
+            limit: int = INITIAL_LIMIT) -> None:
+        self.process = process
+        self.interval = interval
+        self.limit = limit
+        self.allocations = 0
+        self.collections = 0
+
+    def allocating(self) -> None:
+        memory = self.process.memory
+        self.allocations += 1
+
+        if (self.allocations >= self.interval or
+                (not memory.free and memory.next_index >= self.limit)):
+            self.collect()
+
+    def mark(self) -> set:
+        memory = self.process.memory
+        stacks = memory.stacks
+        marked = set()
+        pending = list(self.process.registers)
+
+        for stream in self.process.streams:
+            pending.extend(stream)
+
+        while pending:
+            index, _ = memory.locate(exact(pending.pop()))
+
+            if (index < len(stacks) and index not in marked and
+                    stacks[index] is not None):
+                marked.add(index)
+                stack = stacks[index]
+
+                if type(stack) is Heap:
+                    for priority, value in stack:
+                        pending.append(priority)
+                        pending.append(value)
+                elif type(stack) is SparseStack:
+                    pending.extend(stack.populated())
+                else:
+                    pending.extend(stack)
+
+                # Maps refer through their values as well as their keys
+                if type(stack) is Map:
+                    pending.extend(stack.values())
+
+        return marked
+
+    def collect(self) -> int:
+        # Returns the number of stacks freed
+        memory = self.process.memory
+        marked = self.mark()
+        count = 0
+
+        for index, stack in enumerate(memory.stacks):
+            if stack is not None and index not in marked:
+                memory.release(index)
+                count += 1
+
+        self.allocations = 0
+        self.collections += 1
+        self.limit = max(self.limit, 2 * len(marked))
+        return count
@@ -1,57 +1,682 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from copy import copy
 from fractions import Fraction as Q
+from heapq import heappop, heappush, nlargest
+from itertools import chain
+from math import gcd
+from operator import itemgetter
 
-from quest.utils import fraction_to_index, next_fraction
+from quest.utils import index_to_fraction
+
+# Stacks of at least this many items are allocated as sparse stacks
+SPARSE_SIZE = 1 << 16
+
+# Stack types that support slicing
+SLICEABLE_TYPES = list, array
+
+# Statistics whose peaks are tracked by sampling
+PEAK_KEYS = 'live_stacks', 'total_items', 'max_index', 'largest_size'
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+
+class StackFilled(Exception):
+    # Raised by a sparse stack, after a write, when it should be dense
+    pass
+
+
+class SparseStack:
+    """Stack whose items are zero until written
+
+    Items are stored in pages that are allocated on the first write to
+    them. A page is an array of 64-bit integers until it is given a value
+    that does not fit. Once half of the stack is paged in, writes raise
+    StackFilled, and the memory replaces the stack with its dense form.
+    """
+
+    __slots__ = ('pages', 'size')
+
+    def __init__(self, size: int) -> None:
+        self.pages = {}
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        for offset in range(self.size):
+            yield self[offset]
+
+    def __getitem__(self, offset: int) -> Q:
+        page = self.pages.get(offset >> PAGE_BITS)
+        return 0 if page is None else page[offset & PAGE_MASK]
+
+    def __setitem__(self, offset: int, value: Q) -> None:
+        key = offset >> PAGE_BITS
+        page = self.pages.get(key)
+        filled = False
+
+        if page is None:
+            page = self.pages[key] = array('q', bytes(8 * PAGE_SIZE))
+            filled = 2 * PAGE_SIZE * len(self.pages) >= self.size
+
+        try:
+            page[offset & PAGE_MASK] = value
+        except (TypeError, OverflowError):
+            page = self.pages[key] = list(page)
+            page[offset & PAGE_MASK] = value
+
+        if filled:
+            raise StackFilled()
+
+    def __copy__(self):
+        stack = SparseStack(self.size)
+        stack.pages = {key: page[:] for key, page in self.pages.items()}
+        return stack
+
+    def append(self, value: Q) -> None:
+        self.size += 1
+        self[self.size - 1] = value
+
+    def pop(self) -> Q:
+        if not self.size:
+            raise IndexError('pop from empty stack')
+
+        self.size -= 1
+        return self[self.size]
+
+    def populated(self):
+        # Values of the paged-in items, without the zeros of the other pages
+        for key, page in self.pages.items():
+            yield from page[:max(0, self.size - (key << PAGE_BITS))]
+
+    def convert(self, function) -> None:
+        for page in self.pages.values():
+            if type(page) is list:
+                page[:] = [function(value) for value in page]
+
+    def densify(self):
+        values = array('q', bytes(8 * self.size))
+
+        for key, page in sorted(self.pages.items()):
+            start = key << PAGE_BITS
+            page = page[:max(0, self.size - start)]
+
+            try:
+                values[start:start + len(page)] = page
+            except TypeError:
+                values = list(values)
+                values[start:start + len(page)] = page
+
+        return values
+
+
+class Container:
+    """Mixin for containers that take the place of a stack
+
+    Containers have no offsets, so indexing them, as ldd and std do, and
+    pushing or popping raise TypeError. The memory works on them through
+    the methods of their base types.
+    """
+
+    __slots__ = ()
+
+    def reject(self, *args):
+        raise TypeError(f'{type(self).__name__} is not a stack')
+
+    __getitem__ = __setitem__ = append = extend = pop = reject
+
+
+class Map(Container, dict):
+    """Map from values to values"""
+
+    __slots__ = ()
+
+    def __copy__(self):
+        return Map(self)
+
+
+class Heap(Container, list):
+    """List of (priority, value) pairs in heap order
+
+    The pair with the lowest priority comes first. Ties are broken by
+    value.
+    """
+
+    __slots__ = ()
+
+    def __copy__(self):
+        return Heap(self)
 
 
 class Memory:
-    def __init__(self) -> None:
+    def __init__(self, rational=Q) -> None:
+        self.rational = rational
         self.stacks = []
-        self.pool = []
-        self.next_base = Q(0)
+
+        # Stack bases by index, kept after the stacks are deleted
+        self.bases = {}
+
+        # Indices of deleted stacks, lowest first
+        self.free = []
+
+        self.next_index = 0
+        self.watchers = {}
+
+        # Indices of stacks that may be shared with a fork or a snapshot,
+        # and are copied before their first write
+        self.shared = set()
+
+        # Called before every allocation, if set
+        self.collector = None
+
+        # Counters, allocation sites by stack index, and peaks of sampled
+        # statistics
+        self.allocations = 0
+        self.deletions = 0
+        self.sites = {}
+        self.peaks = {}
 
     def __getitem__(self, address: Q) -> Q:
-        offset, base = divmod(address, 1)
-        index = fraction_to_index(base)
-        stack = self.stacks[index]
-        return stack[offset % len(stack)]
+        return self.load(self.locate(address))
 
     def __setitem__(self, address: Q, value: Q) -> None:
-        offset, base = divmod(address, 1)
-        index = fraction_to_index(base)
+        self.store(self.locate(address), 0, value)
+
+    def locate(self, address: Q) -> tuple:
+        # Splits an address into its stack index and offset, without
+        # rational arithmetic
+        if type(address) is int:
+            return 0, address
+
+        numerator = address.numerator
+        denominator = address.denominator
+        offset, numerator = divmod(numerator, denominator)
+        index = (denominator - 1) * (denominator - 2) // 2 + numerator
+        return index, offset
+
+    def load(self, location: tuple, delta: int = 0) -> Q:
+        index, offset = location
+        stack = self.stacks[index]
+        return stack[(offset + delta) % len(stack)]
+
+    def store(self, location: tuple, delta: int, value: Q) -> None:
+        index, offset = location
+
+        if index in self.shared:
+            self.unshare(index)
+
+        stack = self.stacks[index]
+        offset = (offset + delta) % len(stack)
+
+        try:
+            stack[offset] = value
+        except (TypeError, OverflowError):
+            self.promote(index)[offset] = value
+        except StackFilled:
+            self.stacks[index] = stack.densify()
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def append(self, index: int, value: Q) -> None:
+        if index in self.shared:
+            self.unshare(index)
+
+        try:
+            self.stacks[index].append(value)
+        except (TypeError, OverflowError):
+            self.promote(index).append(value)
+        except StackFilled:
+            self.stacks[index] = self.stacks[index].densify()
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def remove(self, index: int) -> Q:
+        if index in self.shared:
+            self.unshare(index)
+
+        value = self.stacks[index].pop()
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+        return value
+
+    def prepare(self, index: int, values) -> tuple:
+        # Returns the stack at index and the values in a form that it can
+        # take in bulk, converting the stack if it cannot hold them
+        if index in self.shared:
+            self.unshare(index)
+
         stack = self.stacks[index]
-        stack[offset % len(stack)] = value
 
-    def new(self, size: int = 0) -> Q:
-        if self.pool:
-            base = self.pool.pop()
+        if type(stack) is SparseStack:
+            stack = self.stacks[index] = stack.densify()
+
+        if type(stack) is array:
+            try:
+                values = array('q', values)
+            except (TypeError, OverflowError):
+                stack = self.promote(index)
+
+        return stack, values
+
+    def extend(self, base: Q, values) -> None:
+        index, _ = self.locate(base)
+        stack, values = self.prepare(index, list(values))
+        stack.extend(values)
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def read_slice(self, address: Q, count: int) -> list:
+        if not count:
+            return []
+
+        index, offset = self.locate(address)
+        stack = self.stacks[index]
+        size = len(stack)
+        start = offset % size
+
+        if start + count <= size and type(stack) in SLICEABLE_TYPES:
+            return list(stack[start:start + count])
+
+        return [stack[(start + i) % size] for i in range(count)]
+
+    def write_slice(self, address: Q, values) -> None:
+        values = list(values)
+
+        if not values:
+            return
+
+        index, offset = self.locate(address)
+        stack, values = self.prepare(index, values)
+        size = len(stack)
+        start = offset % size
+
+        if start + len(values) <= size and type(stack) in SLICEABLE_TYPES:
+            stack[start:start + len(values)] = values
         else:
-            base = self.next_base
-            self.next_base = next_fraction(self.next_base)
+            for i, value in enumerate(values):
+                stack[(start + i) % size] = value
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def copy_range(self, source: Q, target: Q, count: int) -> None:
+        # Overlapping ranges are copied as if through a temporary buffer
+        self.write_slice(target, self.read_slice(source, count))
 
-        index = fraction_to_index(base)
+    def fill(self, address: Q, value: Q, count: int) -> None:
+        self.write_slice(address, [value] * count)
+
+    def compare(self, left: Q, right: Q, count: int) -> int:
+        # Compares two ranges item by item, returning -1, 0 or 1
+        left = self.read_slice(left, count)
+        right = self.read_slice(right, count)
+        return (left > right) - (left < right)
+
+    def concatenate(self, target: Q, source: Q) -> None:
+        # Appends the items of the source stack to the target stack
+        index, _ = self.locate(source)
+        self.extend(target, self.stack(index))
+
+    def sort(self, base: Q, stride: int = 1) -> None:
+        # Records of stride items are sorted by their first item, stably
+        if stride < 1:
+            raise ValueError(f'Record size {stride} is not positive')
+
+        index, _ = self.locate(base)
+        stack = self.stack(index)
+
+        if type(stack) is SparseStack:
+            stack = stack.densify()
+
+        if stride == 1:
+            values = sorted(stack)
+        else:
+            values = list(stack)
+
+            if len(values) % stride:
+                raise ValueError(
+                    f'Stack size {len(values)} is not a multiple of the '
+                    f'record size {stride}')
+
+            records = sorted(
+                (values[i:i + stride] for i in range(0, len(values), stride)),
+                key=itemgetter(0))
+
+            values = [value for record in records for value in record]
+
+        if type(stack) is array:
+            values = array('q', values)
+        elif type(stack) is deque:
+            values = deque(values)
+
+        self.stacks[index] = values
+        self.shared.discard(index)
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def search(self, base: Q, value: Q, stride: int = 1) -> int:
+        # Returns the offset of the first record in a sorted stack whose
+        # first item is not less than the value
+        if stride < 1:
+            raise ValueError(f'Record size {stride} is not positive')
+
+        index, _ = self.locate(base)
+        stack = self.stack(index)
+
+        if stride == 1:
+            return bisect_left(stack, value)
+
+        low = 0
+        high = len(stack) // stride
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if stack[middle * stride] < value:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low * stride
+
+    def new(self, size: int = 0, site: int = None) -> Q:
+        # The site is the address of the allocating instruction, if known
+        index = self.claim(site)
+
+        # Stacks start out as arrays of 64-bit integers, or sparse if large.
+        # A negative size gives an empty stack.
+        if size < SPARSE_SIZE:
+            self.stacks[index] = array('q', bytes(8 * max(size, 0)))
+        else:
+            self.stacks[index] = SparseStack(size)
+
+        return self.bases[index]
+
+    def new_map(self, site: int = None) -> Q:
+        # Maps take the place of stacks, and are keyed by value
+        index = self.claim(site)
+        self.stacks[index] = Map()
+        return self.bases[index]
+
+    def new_heap(self, site: int = None) -> Q:
+        index = self.claim(site)
+        self.stacks[index] = Heap()
+        return self.bases[index]
+
+    def claim(self, site: int = None) -> int:
+        # Returns the index for a new stack or container
+        if self.collector is not None:
+            self.collector.allocating()
+
+        if self.free:
+            index = heappop(self.free)
+        else:
+            index = self.allocate()
+
+        self.allocations += 1
+
+        if site is not None:
+            self.sites[index] = site
+
+        return index
+
+    def unshare(self, index: int) -> None:
+        self.stacks[index] = copy(self.stacks[index])
+        self.shared.discard(index)
+
+    def promote(self, index: int) -> list:
+        # Converts a stack to a list, for values that do not fit in an array
+        stack = self.stacks[index] = list(self.stack(index))
+        return stack
+
+    def allocate(self) -> int:
+        # Takes the next unused index that belongs to a stack base
+        index = self.next_index
+        numerator, denominator = index_to_fraction(index)
+
+        while gcd(numerator, denominator) != 1:
+            index += 1
+            numerator, denominator = index_to_fraction(index)
 
         while len(self.stacks) <= index:
             self.stacks.append(None)
 
-        self.stacks[index] = size * [Q(0)]
-        return base
+        if index not in self.bases:
+            self.bases[index] = self.make_base(index)
+
+        self.next_index = index + 1
+        return index
+
+    def make_base(self, index: int) -> Q:
+        numerator, denominator = index_to_fraction(index)
+        return numerator and self.rational(numerator, denominator)
 
     def delete(self, base: Q) -> None:
-        base %= 1
-        index = fraction_to_index(base)
+        index, _ = self.locate(base)
+        self.release(index)
 
+    def release(self, index: int) -> None:
         if self.stacks[index] is not None:
             self.stacks[index] = None
-            self.pool.append(base)
+            self.shared.discard(index)
+            heappush(self.free, index)
+            self.sites.pop(index, None)
+            self.deletions += 1
+
+            if index in self.watchers:
+                self.watchers.pop(index)(index)
 
     def push(self, base: Q, value: Q) -> None:
-        index = fraction_to_index(base % 1)
-        self.stacks[index].append(value)
+        index, _ = self.locate(base)
+        self.append(index, value)
 
     def pop(self, base: Q) -> Q:
-        index = fraction_to_index(base % 1)
-        return self.stacks[index].pop()
+        index, _ = self.locate(base)
+        return self.remove(index)
+
+    def container(self, base: Q, kind: type, write: bool = False):
+        # Returns the container at a base, which must be of the given kind
+        index, _ = self.locate(base)
+
+        if type(self.stacks[index]) is not kind:
+            raise TypeError(f'Not a {kind.__name__.lower()}: {base}')
+
+        if write and index in self.shared:
+            self.unshare(index)
+
+        return self.stacks[index]
+
+    def stack(self, index: int):
+        # Returns the stack at an index, which must not be a container
+        stack = self.stacks[index]
+
+        if isinstance(stack, Container):
+            raise TypeError(f'{type(stack).__name__} is not a stack')
+
+        return stack
+
+    def map_insert(self, base: Q, key: Q, value: Q) -> None:
+        dict.__setitem__(self.container(base, Map, True), key, value)
+
+    def map_lookup(self, base: Q, key: Q, default: Q) -> Q:
+        return self.container(base, Map).get(key, default)
+
+    def map_contains(self, base: Q, key: Q) -> bool:
+        return key in self.container(base, Map)
+
+    def map_remove(self, base: Q, key: Q) -> None:
+        dict.pop(self.container(base, Map, True), key, None)
+
+    def heap_push(self, base: Q, priority: Q, value: Q) -> None:
+        heappush(self.container(base, Heap, True), (priority, value))
+
+    def heap_pop(self, base: Q) -> tuple:
+        return heappop(self.container(base, Heap, True))
+
+    def heap_peek(self, base: Q) -> tuple:
+        return list.__getitem__(self.container(base, Heap), 0)
+
+    def front(self, index: int) -> deque:
+        # Converts a stack to a deque, for pushes and pops at the front
+        stack = self.stack(index)
+
+        if type(stack) is not deque:
+            if type(stack) is SparseStack:
+                stack = stack.densify()
+
+            stack = self.stacks[index] = deque(stack)
+            self.shared.discard(index)
+        elif index in self.shared:
+            self.unshare(index)
+            stack = self.stacks[index]
+
+        return stack
+
+    def push_front(self, base: Q, value: Q) -> None:
+        index, _ = self.locate(base)
+        self.front(index).appendleft(value)
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+    def pop_front(self, base: Q) -> Q:
+        index, _ = self.locate(base)
+        value = self.front(index).popleft()
+
+        if index in self.watchers:
+            self.watchers[index](index)
+
+        return value
+
+    def convert(self, function) -> None:
+        # Applies a function to the values of all stacks but the arrays,
+        # which hold only ints
+        for index, stack in enumerate(self.stacks):
+            if type(stack) is list or type(stack) is deque:
+                self.stacks[index] = type(stack)(
+                    function(value) for value in stack)
+                self.shared.discard(index)
+            elif type(stack) is Heap:
+                self.stacks[index] = Heap(
+                    (function(priority), function(value))
+                    for priority, value in stack)
+
+                self.shared.discard(index)
+            elif type(stack) is Map:
+                self.stacks[index] = Map(
+                    (function(key), function(value))
+                    for key, value in stack.items())
+
+                self.shared.discard(index)
+            elif type(stack) is SparseStack:
+                if index in self.shared:
+                    self.unshare(index)
+
+                self.stacks[index].convert(function)
+
+    def share(self) -> None:
+        self.shared = {
+            index for index, stack in enumerate(self.stacks)
+            if stack is not None
+        }
+
+    def fork(self):
+        # Returns a copy that shares the stacks until either side writes to
+        # them. Watchers and the collector are not copied.
+        memory = copy(self)
+        memory.stacks = list(self.stacks)
+        memory.bases = dict(self.bases)
+        memory.free = list(self.free)
+        memory.watchers = {}
+        memory.collector = None
+        memory.sites = dict(self.sites)
+        memory.peaks = dict(self.peaks)
+
+        self.share()
+        memory.share()
+        return memory
+
+    def snapshot(self) -> tuple:
+        # The stacks are shared with the snapshot, not copied
+        self.share()
+        return list(self.stacks), list(self.free), self.next_index
+
+    def restore(self, snapshot: tuple) -> None:
+        stacks, free, next_index = snapshot
+        self.stacks[:] = stacks
+        self.share()
+
+        # Stacks and free indices from a checkpoint can be indices not
+        # allocated here
+        for index in chain(self.shared, free):
+            if index not in self.bases:
+                self.bases[index] = self.make_base(index)
+
+        self.free[:] = free
+        self.next_index = next_index
+
+    def watch(self, base: Q, callback) -> None:
+        # The callback is called with the stack index after every write to
+        # the stack, and once more when the stack is deleted
+        index, _ = self.locate(base)
+        self.watchers[index] = callback
 
     def size(self, base: Q) -> int:
-        index = fraction_to_index(base % 1)
+        index, _ = self.locate(base)
         return len(self.stacks[index])
+
+    def stats(self, count: int = 10) -> dict:
+        # The largest stacks are listed with their bases, sizes and
+        # allocation sites
+        sizes = [
+            (index, len(stack)) for index, stack in enumerate(self.stacks)
+            if stack is not None
+        ]
+
+        largest = nlargest(count, sizes, key=lambda item: item[1])
+
+        return {
+            'live_stacks': len(sizes),
+            'total_items': sum(size for _, size in sizes),
+            'sizes': {self.bases[index]: size for index, size in sizes},
+            'largest': [
+                (self.bases[index], size, self.sites.get(index))
+                for index, size in largest
+            ],
+            'allocations': self.allocations,
+            'deletions': self.deletions,
+            'free': len(self.free),
+            'max_index': max((index for index, _ in sizes), default=-1),
+            'peaks': dict(self.peaks),
+        }
+
+    def sample(self) -> dict:
+        # Updates and returns the peaks, in one pass over the stacks
+        live_stacks = total_items = largest_size = 0
+        max_index = -1
+
+        for index, stack in enumerate(self.stacks):
+            if stack is not None:
+                size = len(stack)
+                live_stacks += 1
+                total_items += size
+                largest_size = max(largest_size, size)
+                max_index = index
+
+        values = live_stacks, total_items, max_index, largest_size
+
+        for key, value in zip(PEAK_KEYS, values):
+            self.peaks[key] = max(self.peaks.get(key, value), value)
+
+        return dict(self.peaks)
@@ -0,0 +1,200 @@
+from fractions import Fraction
+from math import floor, isfinite
+import os
+
+from quest.rational import LazyRational
+
+try:
+    from gmpy2 import mpq
+except ImportError:
+    mpq = None
+
+# Rational number types by backend name. The types are constructed from a
+# numerator and an optional denominator, which can be ints or rationals.
+BACKENDS = {
+    'fraction': Fraction,
+
+    # Arithmetic on floats where they are exact. Stack bases and machine
+    # code still use Fraction.
+    'float': Fraction,
+
+    # Fractions that postpone gcd reduction
+    'lazy': LazyRational,
+}
+
+if mpq is not None:
+    BACKENDS['gmpy2'] = mpq
+
+DEFAULT_BACKEND = 'fraction'
+
+# Backends whose arithmetic can fail with InexactError
+INEXACT_BACKENDS = {'float'}
+
+# Integers below this magnitude are exactly representable as floats
+MAX_EXACT_INTEGER = 2 ** 53
+
+# Nonzero float products below this magnitude can lose bits to underflow
+MIN_EXACT_PRODUCT = 2.0 ** -969
+
+# Splits a float into two halves whose products are exact (Veltkamp)
+SPLITTER = 2.0 ** 27 + 1
+
+
+class InexactError(ArithmeticError):
+    pass
+
+
+def get_backend_name(name: str = None) -> str:
+    if name is None:
+        name = os.environ.get('QUEST_NUMERIC', DEFAULT_BACKEND)
+
+    if name not in BACKENDS:
+        raise ValueError(f'Unavailable numeric backend: {name}')
+
+    return name
+
+
+def get_rational_type(name: str = None):
+    return BACKENDS[get_backend_name(name)]
+
+
+def exact(value):
+    # Floats convert to fractions without rounding
+    if type(value) is float:
+        return Fraction(value)
+
+    return value
+
+
+def from_exact(q):
+    # Converts an exact rational to an int, or to a float of equal value
+    if q.denominator == 1:
+        return int(q.numerator)
+
+    denominator = q.denominator
+
+    if (denominator & (denominator - 1) == 0 and
+            abs(q.numerator) < MAX_EXACT_INTEGER):
+        value = float(q)
+
+        if value == q:
+            return value
+
+    raise InexactError(f'No exact float for {q}')
+
+
+def is_float_compatible(value) -> bool:
+    return type(value) is float or (
+        type(value) is int and -MAX_EXACT_INTEGER < value < MAX_EXACT_INTEGER)
+
+
+def from_float(value: float):
+    if not isfinite(value):
+        raise InexactError(f'No exact float for {value}')
+
+    return int(value) if value.is_integer() else value
+
+
+def split(a: float) -> tuple:
+    c = SPLITTER * a
+    high = c - (c - a)
+    return high, a - high
+
+
+def two_product(a: float, b: float) -> tuple:
+    # Returns the rounded product and its rounding error (Dekker)
+    product = a * b
+    a_high, a_low = split(a)
+    b_high, b_low = split(b)
+
+    error = (
+        ((a_high * b_high - product) + a_high * b_low + a_low * b_high) +
+        a_low * b_low)
+
+    return product, error
+
+
+def float_sum(left, right):
+    if type(left) is int and type(right) is int:
+        return left + right
+
+    if is_float_compatible(left) and is_float_compatible(right):
+        total = left + right
+
+        # The rounding error of the sum (Knuth's TwoSum)
+        right_part = total - left
+        left_part = total - right_part
+        error = (left - left_part) + (right - right_part)
+
+        if error:
+            raise InexactError(f'No exact float for {left} + {right}')
+
+        return from_float(total)
+
+    return from_exact(exact(left) + exact(right))
+
+
+def float_product(left, right):
+    if type(left) is int and type(right) is int:
+        return left * right
+
+    if is_float_compatible(left) and is_float_compatible(right):
+        product, error = two_product(float(left), float(right))
+
+        if product and abs(product) < MIN_EXACT_PRODUCT:
+            return from_exact(exact(left) * exact(right))
+
+        if error:
+            raise InexactError(f'No exact float for {left} * {right}')
+
+        return from_float(product)
+
+    return from_exact(exact(left) * exact(right))
+
+
+def float_quotient(left, right):
+    if type(left) is int and type(right) is int:
+        if right and not left % right:
+            return left // right
+
+    if is_float_compatible(left) and is_float_compatible(right) and right:
+        quotient = left / right
+
+        # The quotient is exact if multiplying back gives the dividend
+        product, error = two_product(quotient, float(right))
+
+        if (product and abs(product) < MIN_EXACT_PRODUCT) or not quotient:
+            return from_exact(Fraction(exact(left), exact(right)))
+
+        if product != left or error:
+            raise InexactError(f'No exact float for {left} / {right}')
+
+        return from_float(quotient)
+
+    return from_exact(Fraction(exact(left), exact(right)))
+
+
+def power(base, exponent, rational=Fraction):
+    # Raises a rational to an integral power without rounding
+    if exponent.denominator != 1:
+        raise ValueError(f'Non-integral exponent: {exponent}')
+
+    exponent = int(exponent)
+
+    if exponent < 0:
+        return rational(1, base ** -exponent)
+
+    return base ** exponent
+
+
+def power_modulo(base, exponent, modulus) -> int:
+    # Raises an integer to an integral power modulo an integer
+    for value in base, exponent, modulus:
+        if value != floor(value):
+            raise ValueError(f'Non-integral operand: {value}')
+
+    return pow(int(base), int(exponent), int(modulus))
+
+
+def float_power(base, exponent):
+    return from_exact(power(exact(base), exact(exponent)))
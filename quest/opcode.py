@@ -4,6 +4,7 @@ from fractions import Fraction as Q
 
 @unique
 class Opcode(Enum):
+	ABS = Q(7, 15)
 	ADD = Q(5, 7)
 	ADI = Q(3, 7)
 	BAL = Q(7, 10)
@@ -13,8 +14,12 @@ class Opcode(Enum):
 	BLE = Q(1, 10)
 	BLT = Q(3, 11)
 	BNE = Q(3, 10)
+	CAT = Q(12, 13)
+	CEL = Q(8, 15)
 	CLD = Q(5, 11)
 	CLS = Q(4, 11)
+	CMP = Q(1, 14)
+	CPY = Q(3, 14)
 	DEL = Q(4, 9)
 	DEN = Q(6, 11)
 	DIS = Q(2, 11)
@@ -22,25 +27,55 @@ class Opcode(Enum):
 	DUP = Q(1, 5)
 	ENT = Q(1, 2)
 	FDI = Q(4, 7)
+	FIL = Q(5, 14)
+	FLR = Q(11, 15)
 	GET = Q(10, 11)
+	GTD = Q(9, 14)
+	GTI = Q(11, 14)
+	GTN = Q(13, 14)
+	HAS = Q(4, 13)
 	HCF = Q(7, 9)
+	HEP = Q(6, 13)
+	HPK = Q(9, 13)
+	HPP = Q(8, 13)
+	HPS = Q(7, 13)
+	INS = Q(2, 13)
 	INV = Q(5, 6)
 	LDD = Q(1, 7)
 	LDI = Q(0)
 	LDL = Q(1, 11)
 	LDR = Q(7, 11)
 	LDS = Q(8, 11)
+	LKP = Q(3, 13)
+	MAP = Q(1, 13)
+	MAX = Q(13, 15)
+	MIN = Q(14, 15)
 	MOD = Q(2, 9)
 	MUL = Q(1, 8)
 	MLI = Q(1, 4)
 	NEG = Q(3, 8)
 	NEW = Q(2, 3)
 	NUM = Q(4, 5)
+	POF = Q(11, 12)
 	POP = Q(2, 7)
+	POW = Q(1, 16)
+	PSF = Q(7, 12)
 	PSH = Q(1, 3)
+	PTI = Q(1, 15)
+	PTN = Q(2, 15)
+	PTS = Q(4, 15)
 	PUT = Q(9, 11)
+	PWM = Q(3, 16)
+	REM = Q(5, 13)
 	RET = Q(8, 9)
+	SCH = Q(11, 13)
+	SEQ = Q(5, 16)
+	SGN = Q(7, 16)
 	SIZ = Q(3, 4)
+	SLE = Q(9, 16)
+	SLT = Q(11, 16)
+	SNE = Q(13, 16)
+	SRT = Q(10, 13)
 	STD = Q(3, 5)
 	STL = Q(7, 8)
 	STR = Q(5, 8)
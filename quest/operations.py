@@ -1,19 +1,27 @@
-from fractions import Fraction as Q
-from math import floor
+from math import ceil, floor
 
 from quest.opcode import Opcode
+from quest.numeric import (
+    exact, float_power, float_product, float_quotient, float_sum, from_exact,
+    power, power_modulo)
 from quest.register import Register
+from quest.stdio import read_integer, read_until, read_values, write_number
+from quest.utils import normalize
 
 IR = Register.IR.value
 DR = Register.DR.value
 CR = Register.CR.value
 
 
+def absolute(process, operand):
+    process.push_data(abs(process.pop_data()))
+
+
 def add(process, operand):
     right = process.pop_data()
     left = process.pop_data()
 
-    process.push_data(left + right)
+    process.push_data(normalize(left + right))
 
 
 def add_integer(process, operand):
@@ -22,37 +30,42 @@ def add_integer(process, operand):
 
 
 def branch_always(process, operand):
-    process.registers[IR] = Q(operand)
+    process.registers[IR] = operand
 
 
 def branch_equal(process, operand):
     if not process.pop_data():
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
 
 
 def branch_greater_equal(process, operand):
     if process.pop_data() >= 0:
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
 
 
 def branch_greater_than(process, operand):
     if process.pop_data() > 0:
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
 
 
 def branch_less_equal(process, operand):
     if process.pop_data() <= 0:
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
 
 
 def branch_less_than(process, operand):
     if process.pop_data() < 0:
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
 
 
 def branch_not_equal(process, operand):
     if process.pop_data():
-        process.registers[IR] = Q(operand)
+        process.registers[IR] = operand
+
+
+def ceiling(process, operand):
+    value = process.pop_data()
+    process.push_data(normalize(ceil(value)))
 
 
 def call_dynamic(process, operand):
@@ -63,7 +76,27 @@ def call_dynamic(process, operand):
 
 def call_static(process, operand):
     process.push_call(process.registers[IR])
-    process.registers[IR] = Q(operand)
+    process.registers[IR] = operand
+
+
+def compare(process, operand):
+    count = process.pop_data()
+    right = process.pop_data()
+    left = process.pop_data()
+    process.push_data(process.memory.compare(left, right, count))
+
+
+def concatenate(process, operand):
+    source = process.pop_data()
+    target = process.pop_data()
+    process.memory.concatenate(target, source)
+
+
+def copy(process, operand):
+    count = process.pop_data()
+    target = process.pop_data()
+    source = process.pop_data()
+    process.memory.copy_range(source, target, count)
 
 
 def delete(process, operand):
@@ -73,7 +106,7 @@ def delete(process, operand):
 
 def denominator(process, operand):
     value = process.pop_data()
-    value = Q(value.denominator)
+    value = normalize(value.denominator)
     process.push_data(value)
 
 
@@ -81,23 +114,34 @@ def divide(process, operand):
     right = process.pop_data()
     left = process.pop_data()
 
-    process.push_data(left / right)
+    process.push_data(normalize(process.rational(left, right)))
 
 
 def duplicate(process, operand):
-    address = process.registers[DR] - 1 - operand
-    value = process.memory[address]
+    value = process.memory.load(process.locations[DR], -1 - operand)
     process.push_data(value)
 
 
 def enter(process, operand):
     for _ in range(operand):
-        process.push_call(Q(0))
+        process.push_call(0)
+
+
+def fill(process, operand):
+    count = process.pop_data()
+    address = process.pop_data()
+    value = process.pop_data()
+    process.memory.fill(address, value, count)
+
+
+def floor_(process, operand):
+    value = process.pop_data()
+    process.push_data(normalize(floor(value)))
 
 
 def floor_divide_integer(process, operand):
     value = process.pop_data()
-    process.push_data(Q(value // operand))
+    process.push_data(normalize(value // operand))
 
 
 def get(process, operand):
@@ -107,24 +151,81 @@ def get(process, operand):
     process.push_data(value)
 
 
+def has_key(process, operand):
+    handle = process.pop_data()
+    key = process.pop_data()
+    process.push_data(int(process.memory.map_contains(handle, key)))
+
+
+def get_delimited(process, operand):
+    handle = floor(process.pop_data())
+    delimiter = process.pop_data()
+    base = process.pop_data()
+    values = read_until(process.streams[handle], delimiter)
+    process.memory.extend(base, values)
+    process.push_data(len(values))
+
+
+def get_integer(process, operand):
+    handle = floor(process.pop_data())
+    value = read_integer(process.streams[handle])
+    process.push_data(value)
+
+
+def get_values(process, operand):
+    handle = floor(process.pop_data())
+    count = process.pop_data()
+    base = process.pop_data()
+    values = read_values(process.streams[handle], count)
+    process.memory.extend(base, values)
+    process.push_data(len(values))
+
+
 def halt(process, operand):
     raise RuntimeError('Halt')
 
 
+def heap_peek(process, operand):
+    handle = process.pop_data()
+    priority, value = process.memory.heap_peek(handle)
+    process.push_data(value)
+    process.push_data(priority)
+
+
+def heap_pop(process, operand):
+    handle = process.pop_data()
+    priority, value = process.memory.heap_pop(handle)
+    process.push_data(value)
+    process.push_data(priority)
+
+
+def heap_push(process, operand):
+    handle = process.pop_data()
+    priority = process.pop_data()
+    value = process.pop_data()
+    process.memory.heap_push(handle, priority, value)
+
+
+def insert(process, operand):
+    handle = process.pop_data()
+    key = process.pop_data()
+    value = process.pop_data()
+    process.memory.map_insert(handle, key, value)
+
+
 def invert(process, operand):
     value = process.pop_data()
-    process.push_data(1 / value)
+    process.push_data(normalize(process.rational(1, value)))
 
 
 def load_dynamic(process, operand):
-    address = process.pop_data() + operand
-    value = process.memory[address]
+    location = process.memory.locate(process.pop_data())
+    value = process.memory.load(location, operand)
     process.push_data(value)
 
 
 def load_local(process, operand):
-    address = process.registers[CR] - 1 - operand
-    value = process.memory[address]
+    value = process.memory.load(process.locations[CR], -1 - operand)
     process.push_data(value)
 
 
@@ -134,27 +235,57 @@ def load_register(process, operand):
 
 
 def load_static(process, operand):
-    value = process.memory[Q(operand)]
+    value = process.memory[operand]
+    process.push_data(value)
+
+
+def lookup(process, operand):
+    handle = process.pop_data()
+    key = process.pop_data()
+    default = process.pop_data()
+    value = process.memory.map_lookup(handle, key, default)
     process.push_data(value)
 
 
+def maximum(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(max(left, right))
+
+
+def minimum(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(min(left, right))
+
+
+def modular_power(process, operand):
+    modulus = process.pop_data()
+    exponent = process.pop_data()
+    base = process.pop_data()
+
+    process.push_data(normalize(power_modulo(base, exponent, modulus)))
+
+
 def modulo(process, operand):
     right = process.pop_data()
     left = process.pop_data()
 
-    process.push_data(left % right)
+    process.push_data(normalize(left % right))
 
 
 def multiply(process, operand):
     right = process.pop_data()
     left = process.pop_data()
 
-    process.push_data(left * right)
+    process.push_data(normalize(left * right))
 
 
 def multiply_integer(process, operand):
     value = process.pop_data()
-    process.push_data(value * operand)
+    process.push_data(normalize(value * operand))
 
 
 def negate(process, operand):
@@ -162,13 +293,23 @@ def negate(process, operand):
 
 
 def new(process, operand):
-    array = process.memory.new(operand)
+    array = process.memory.new(operand, process.registers[IR] - 1)
     process.push_data(array)
 
 
+def new_heap(process, operand):
+    heap = process.memory.new_heap(process.registers[IR] - 1)
+    process.push_data(heap)
+
+
+def new_map(process, operand):
+    map_ = process.memory.new_map(process.registers[IR] - 1)
+    process.push_data(map_)
+
+
 def numerator(process, operand):
     value = process.pop_data()
-    value = Q(value.numerator)
+    value = normalize(value.numerator)
     process.push_data(value)
 
 
@@ -177,7 +318,7 @@ def discard(process, operand):
 
 
 def load_integer(process, operand):
-    process.push_data(Q(operand))
+    process.push_data(operand)
 
 
 def pop(process, operand):
@@ -186,12 +327,31 @@ def pop(process, operand):
     process.push_data(value)
 
 
+def pop_front(process, operand):
+    handle = process.pop_data()
+    value = process.memory.pop_front(handle)
+    process.push_data(value)
+
+
+def power_(process, operand):
+    exponent = process.pop_data()
+    base = process.pop_data()
+
+    process.push_data(normalize(power(base, exponent, process.rational)))
+
+
 def push(process, operand):
     handle = process.pop_data()
     value = process.pop_data()
     process.memory.push(handle, value)
 
 
+def push_front(process, operand):
+    handle = process.pop_data()
+    value = process.pop_data()
+    process.memory.push_front(handle, value)
+
+
 def put(process, operand):
     handle = floor(process.pop_data())
     stream = process.streams[handle]
@@ -199,6 +359,33 @@ def put(process, operand):
     stream.append(value)
 
 
+def remove(process, operand):
+    handle = process.pop_data()
+    key = process.pop_data()
+    process.memory.map_remove(handle, key)
+
+
+def put_integer(process, operand):
+    handle = floor(process.pop_data())
+    value = process.pop_data()
+    write_number(process.streams[handle], value)
+
+
+def put_stack(process, operand):
+    handle = floor(process.pop_data())
+    base = process.pop_data()
+    values = process.memory.read_slice(base, process.memory.size(base))
+    process.streams[handle].extend(values)
+
+
+def put_values(process, operand):
+    handle = floor(process.pop_data())
+    count = process.pop_data()
+    address = process.pop_data()
+    values = process.memory.read_slice(address, count)
+    process.streams[handle].extend(values)
+
+
 def return_(process, operand):
     for _ in range(operand):
         process.pop_call()
@@ -206,31 +393,75 @@ def return_(process, operand):
     process.registers[IR] = process.pop_call()
 
 
+def search(process, operand):
+    handle = process.pop_data()
+    value = process.pop_data()
+    offset = process.memory.search(handle, value, operand or 1)
+    process.push_data(offset)
+
+
+def set_equal(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(int(left == right))
+
+
+def set_less_equal(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(int(left <= right))
+
+
+def set_less_than(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(int(left < right))
+
+
+def set_not_equal(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(int(left != right))
+
+
+def sign(process, operand):
+    value = process.pop_data()
+    process.push_data((value > 0) - (value < 0))
+
+
 def size(process, operand):
     handle = process.pop_data()
     size = process.memory.size(handle)
-    process.push_data(Q(size))
+    process.push_data(size)
+
+
+def sort(process, operand):
+    handle = process.pop_data()
+    process.memory.sort(handle, operand or 1)
 
 
 def store_dynamic(process, operand):
-    address = process.pop_data() + operand
+    location = process.memory.locate(process.pop_data())
     value = process.pop_data()
-    process.memory[address] = value
+    process.memory.store(location, operand, value)
 
 
 def store_local(process, operand):
-    address = process.registers[CR] - 1 - operand
     value = process.pop_data()
-    process.memory[address] = value
+    process.memory.store(process.locations[CR], -1 - operand, value)
 
 
 def store_register(process, operand):
     value = process.pop_data()
-    process.registers[operand] = value
+    process.set_register(operand, value)
 
 
 def store_static(process, operand):
-    address = Q(operand)
+    address = operand
     value = process.pop_data()
     process.memory[address] = value
 
@@ -239,7 +470,7 @@ def subtract(process, operand):
     right = process.pop_data()
     left = process.pop_data()
 
-    process.push_data(left - right)
+    process.push_data(normalize(left - right))
 
 
 def swap(process, operand):
@@ -254,10 +485,171 @@ def tell(process, operand):
     handle = floor(process.pop_data())
     stream = process.streams[handle]
     size = len(stream)
-    process.push_data(Q(size))
+    process.push_data(size)
+
+
+def add_integer_branch_always(process, operands):
+    increment, target = operands
+    value = process.pop_data()
+    process.push_data(value + increment)
+    process.registers[IR] = target
+
+
+def duplicate_add_integer_branch_equal(process, operands):
+    depth, increment, target = operands
+    value = process.memory.load(process.locations[DR], -1 - depth)
+
+    if not value + increment:
+        process.registers[IR] = target
+
+
+def load_local_add_store_local(process, operands):
+    source, _, target = operands
+    location = process.locations[CR]
+    value = process.pop_data()
+    value = normalize(value + process.memory.load(location, -1 - source))
+    process.memory.store(location, -1 - target, value)
+
+
+def load_local_add_integer_store_local(process, operands):
+    source, increment, target = operands
+    location = process.locations[CR]
+    value = process.memory.load(location, -1 - source) + increment
+    process.memory.store(location, -1 - target, value)
+
+
+def load_local_branch_equal(process, operands):
+    source, target = operands
+
+    if not process.memory.load(process.locations[CR], -1 - source):
+        process.registers[IR] = target
+
+
+def load_local_put(process, operands):
+    source, _ = operands
+    handle = floor(process.memory.load(process.locations[CR], -1 - source))
+    stream = process.streams[handle]
+    value = process.pop_data()
+    stream.append(value)
+
+
+def float_add(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(float_sum(left, right))
+
+
+def float_add_integer(process, operand):
+    value = process.pop_data()
+    process.push_data(float_sum(value, operand))
+
+
+def float_denominator(process, operand):
+    value = exact(process.pop_data())
+    value = normalize(value.denominator)
+    process.push_data(value)
+
+
+def float_divide(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(float_quotient(left, right))
+
+
+def float_floor_divide_integer(process, operand):
+    value = exact(process.pop_data())
+    process.push_data(normalize(value // operand))
+
+
+def float_invert(process, operand):
+    value = process.pop_data()
+    process.push_data(float_quotient(1, value))
+
+
+def float_modulo(process, operand):
+    right = exact(process.pop_data())
+    left = exact(process.pop_data())
+
+    process.push_data(from_exact(left % right))
+
+
+def float_multiply(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(float_product(left, right))
+
+
+def float_multiply_integer(process, operand):
+    value = process.pop_data()
+    process.push_data(float_product(value, operand))
+
+
+def float_numerator(process, operand):
+    value = exact(process.pop_data())
+    value = normalize(value.numerator)
+    process.push_data(value)
+
+
+def float_power_(process, operand):
+    exponent = process.pop_data()
+    base = process.pop_data()
+
+    process.push_data(float_power(base, exponent))
+
+
+def float_put_integer(process, operand):
+    handle = floor(process.pop_data())
+    value = exact(process.pop_data())
+    write_number(process.streams[handle], value)
+
+
+def float_subtract(process, operand):
+    right = process.pop_data()
+    left = process.pop_data()
+
+    process.push_data(float_sum(left, -right))
+
+
+def exact_address(operation):
+    # Wraps an operation that takes an address or handle from the top of
+    # the data stack, which must be exact when used by memory
+    def float_operation(process, operand):
+        value = process.pop_data()
+        process.push_data(exact(value))
+        operation(process, operand)
+
+    return float_operation
+
+
+def exact_operands(operation, count: int):
+    # Like exact_address, for operations that take several addresses or
+    # sizes from the top of the data stack
+    def float_operation(process, operand):
+        values = [exact(process.pop_data()) for _ in range(count)]
+
+        for value in reversed(values):
+            process.push_data(value)
+
+        operation(process, operand)
+
+    return float_operation
+
+
+def fuse(opcodes: tuple):
+    operations = tuple(OPERATIONS[opcode] for opcode in opcodes)
+
+    def superinstruction(process, operands):
+        for operation, operand in zip(operations, operands):
+            operation(process, operand)
+
+    return superinstruction
 
 
 OPERATIONS = {
+    Opcode.ABS: absolute,
     Opcode.ADD: add,
     Opcode.ADI: add_integer,
     Opcode.BAL: branch_always,
@@ -267,21 +659,40 @@ OPERATIONS = {
     Opcode.BLE: branch_less_equal,
     Opcode.BLT: branch_less_than,
     Opcode.BNE: branch_not_equal,
+    Opcode.CAT: concatenate,
+    Opcode.CEL: ceiling,
     Opcode.CLD: call_dynamic,
     Opcode.CLS: call_static,
+    Opcode.CMP: compare,
+    Opcode.CPY: copy,
     Opcode.DEL: delete,
     Opcode.DEN: denominator,
     Opcode.DIV: divide,
     Opcode.DUP: duplicate,
     Opcode.ENT: enter,
     Opcode.FDI: floor_divide_integer,
+    Opcode.FIL: fill,
+    Opcode.FLR: floor_,
     Opcode.GET: get,
+    Opcode.GTD: get_delimited,
+    Opcode.GTI: get_integer,
+    Opcode.GTN: get_values,
+    Opcode.HAS: has_key,
     Opcode.HCF: halt,
+    Opcode.HEP: new_heap,
+    Opcode.HPK: heap_peek,
+    Opcode.HPP: heap_pop,
+    Opcode.HPS: heap_push,
+    Opcode.INS: insert,
     Opcode.INV: invert,
     Opcode.LDD: load_dynamic,
     Opcode.LDL: load_local,
     Opcode.LDR: load_register,
     Opcode.LDS: load_static,
+    Opcode.LKP: lookup,
+    Opcode.MAP: new_map,
+    Opcode.MAX: maximum,
+    Opcode.MIN: minimum,
     Opcode.MOD: modulo,
     Opcode.MUL: multiply,
     Opcode.MLI: multiply_integer,
@@ -290,11 +701,26 @@ OPERATIONS = {
     Opcode.NUM: numerator,
     Opcode.DIS: discard,
     Opcode.LDI: load_integer,
+    Opcode.POF: pop_front,
     Opcode.POP: pop,
+    Opcode.POW: power_,
+    Opcode.PSF: push_front,
     Opcode.PSH: push,
+    Opcode.PTI: put_integer,
+    Opcode.PTN: put_values,
+    Opcode.PTS: put_stack,
     Opcode.PUT: put,
+    Opcode.PWM: modular_power,
+    Opcode.REM: remove,
     Opcode.RET: return_,
+    Opcode.SCH: search,
+    Opcode.SEQ: set_equal,
+    Opcode.SGN: sign,
     Opcode.SIZ: size,
+    Opcode.SLE: set_less_equal,
+    Opcode.SLT: set_less_than,
+    Opcode.SNE: set_not_equal,
+    Opcode.SRT: sort,
     Opcode.STD: store_dynamic,
     Opcode.STL: store_local,
     Opcode.STR: store_register,
@@ -303,3 +729,57 @@ OPERATIONS = {
     Opcode.SWP: swap,
     Opcode.TEL: tell,
 }
+
+SUPERINSTRUCTIONS = {
+    (Opcode.ADI, Opcode.BAL): add_integer_branch_always,
+    (Opcode.DUP, Opcode.ADI, Opcode.BEQ): duplicate_add_integer_branch_equal,
+    (Opcode.LDL, Opcode.ADD, Opcode.STL): load_local_add_store_local,
+    (Opcode.LDL, Opcode.ADI, Opcode.STL): load_local_add_integer_store_local,
+    (Opcode.LDL, Opcode.BEQ): load_local_branch_equal,
+    (Opcode.LDL, Opcode.PUT): load_local_put,
+}
+
+# Arithmetic on floats where they are exact, for the float numeric backend
+FLOAT_OPERATIONS = {
+    **OPERATIONS,
+    Opcode.ADD: float_add,
+    Opcode.ADI: float_add_integer,
+    Opcode.CAT: exact_operands(concatenate, 2),
+    Opcode.CLD: exact_address(call_dynamic),
+    Opcode.CMP: exact_operands(compare, 3),
+    Opcode.CPY: exact_operands(copy, 3),
+    Opcode.DEL: exact_address(delete),
+    Opcode.DEN: float_denominator,
+    Opcode.DIV: float_divide,
+    Opcode.FDI: float_floor_divide_integer,
+    Opcode.FIL: exact_operands(fill, 2),
+    Opcode.GTD: exact_operands(get_delimited, 3),
+    Opcode.GTN: exact_operands(get_values, 3),
+    Opcode.HAS: exact_address(has_key),
+    Opcode.HPK: exact_address(heap_peek),
+    Opcode.HPP: exact_address(heap_pop),
+    Opcode.HPS: exact_address(heap_push),
+    Opcode.INS: exact_address(insert),
+    Opcode.INV: float_invert,
+    Opcode.LDD: exact_address(load_dynamic),
+    Opcode.LKP: exact_address(lookup),
+    Opcode.MOD: float_modulo,
+    Opcode.MUL: float_multiply,
+    Opcode.MLI: float_multiply_integer,
+    Opcode.NUM: float_numerator,
+    Opcode.POF: exact_address(pop_front),
+    Opcode.POP: exact_address(pop),
+    Opcode.POW: float_power_,
+    Opcode.PSF: exact_address(push_front),
+    Opcode.PSH: exact_address(push),
+    Opcode.PTI: float_put_integer,
+    Opcode.PTN: exact_operands(put_values, 3),
+    Opcode.PTS: exact_operands(put_stack, 2),
+    Opcode.REM: exact_address(remove),
+    Opcode.SCH: exact_address(search),
+    Opcode.SIZ: exact_address(size),
+    Opcode.SRT: exact_address(sort),
+    Opcode.STD: exact_address(store_dynamic),
+    Opcode.STR: exact_address(store_register),
+    Opcode.SUB: float_subtract,
+}
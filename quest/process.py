@@ -1,13 +1,20 @@
 from collections import defaultdict, deque
+from copy import copy
 from fractions import Fraction as Q
 from math import floor
 
+from quest import checkpoint
+from quest.blocks import BlockEngine
+from quest.collector import GarbageCollector
 from quest.memory import Memory
+from quest.numeric import (
+    BACKENDS, INEXACT_BACKENDS, InexactError, exact, get_backend_name)
 from quest.opcode import Opcode
-from quest.operations import OPERATIONS
+from quest.operations import FLOAT_OPERATIONS, OPERATIONS
 from quest.register import Register
-from quest.stdio import StandardStream
-from quest.utils import fraction_to_index
+from quest.stdio import StandardStream, has_integer
+from quest.tracing import TraceEngine
+from quest.utils import fraction_to_index, normalize
 
 IR = Register.IR.value
 DR = Register.DR.value
@@ -18,97 +25,346 @@ STDOUT = StandardStream.STDOUT.value
 STDERR = StandardStream.STDERR.value
 
 GET_INDEX = fraction_to_index(Opcode.GET.value)
+GTD_INDEX = fraction_to_index(Opcode.GTD.value)
+GTI_INDEX = fraction_to_index(Opcode.GTI.value)
+GTN_INDEX = fraction_to_index(Opcode.GTN.value)
 HCF_INDEX = fraction_to_index(Opcode.HCF.value)
 
-INDEX_TO_OPERATION = 256 * [None]
+# Instructions that block until their stream holds the input they read
+READER_INDICES = {GET_INDEX, GTD_INDEX, GTI_INDEX, GTN_INDEX}
 
-for opcode, operation in OPERATIONS.items():
-    index = fraction_to_index(opcode.value)
-    INDEX_TO_OPERATION[index] = operation
 
+def index_operations(operations: dict) -> list:
+    index_to_operation = 256 * [None]
 
-class Process:
-    def __init__(self, machine_code: list = [], argv: list = []) -> None:
-        self.registers = len(Register) * [Q(0)]
-        self.memory = Memory()
+    for opcode, operation in operations.items():
+        index = fraction_to_index(opcode.value)
+        index_to_operation[index] = operation
+
+    return index_to_operation
+
+
+INDEX_TO_OPERATION = index_operations(OPERATIONS)
+INDEX_TO_FLOAT_OPERATION = index_operations(FLOAT_OPERATIONS)
 
-        self.registers[IR] = self.memory.new()
-        self.registers[DR] = self.memory.new()
-        self.registers[CR] = self.memory.new()
+ENGINES = {
+    'interpreter': None,
+    'blocks': BlockEngine,
+    'trace': TraceEngine,
+}
+
+
+class Process:
+    def __init__(
+            self, machine_code: list = [], argv: list = [],
+            engine: str = 'interpreter', superinstructions=None,
+            numeric: str = None, collect_garbage: bool = False,
+            sample_interval: int = None) -> None:
+        self.numeric = numeric = get_backend_name(numeric)
+        self.rational = BACKENDS[numeric]
+        self.exact = numeric not in INEXACT_BACKENDS
+
+        if self.exact:
+            self.operations = INDEX_TO_OPERATION
+        else:
+            # Generated code and superinstructions do exact arithmetic only
+            if engine == 'trace' or superinstructions is not None:
+                raise ValueError(
+                    f'Numeric backend {numeric} needs the interpreter or '
+                    f'the blocks engine, without superinstructions')
+
+            self.operations = INDEX_TO_FLOAT_OPERATION
+
+        self.registers = len(Register) * [0]
+        self.memory = Memory(self.rational)
+
+        # Stack indices and offsets of the register values
+        self.locations = len(Register) * [(0, 0)]
+
+        for register in Register:
+            self.set_register(register.value, self.memory.new())
 
         self.streams = [deque() for _ in StandardStream]
+        self.superinstructions = superinstructions
+        self.engine_class = ENGINES[engine]
 
-        for instruction in machine_code:
-            self.push_instruction(instruction)
+        # Functions that the interpreter calls periodically, with their
+        # intervals in steps
+        self.hooks = []
+
+        # Steps between samples of the memory statistics, if sampled
+        self.sample_interval = sample_interval
+
+        if sample_interval is not None:
+            self.every(sample_interval, self.memory.sample)
+
+        self.decoded = {}
+        self.steps = {}
+        self.code_version = 0
+
+        self.load_code(machine_code)
 
         argv_base = self.memory.new()
+        arg_bases = []
 
         for arg in argv:
             arg_base = self.memory.new()
+            self.memory.extend(arg_base, map(ord, arg))
+            arg_bases.append(arg_base)
 
-            for char in arg:
-                self.memory.push(arg_base, Q(ord(char)))
+        self.memory.extend(argv_base, arg_bases)
+        self.push_data(argv_base)
 
-            self.memory.push(argv_base, arg_base)
+        if collect_garbage:
+            self.memory.collector = GarbageCollector(self)
 
-        self.push_data(argv_base)
+        self.engine = self.engine_class and self.engine_class(self)
 
     def push_instruction(self, value: Q) -> None:
-        self.memory.push(self.registers[IR], value)
+        self.memory.push(self.registers[IR], normalize(self.rational(value)))
+
+    def load_code(self, machine_code: list) -> None:
+        # Appends machine code to the code stack in one write
+        rational = self.rational
+
+        self.memory.extend(self.registers[IR], [
+            normalize(value if type(value) is rational else rational(value))
+            for value in machine_code
+        ])
+
+    def set_register(self, register: int, value: Q) -> None:
+        self.registers[register] = value
+        self.locations[register] = self.memory.locate(value)
 
     def push_data(self, value: Q) -> None:
-        self.memory.push(self.registers[DR], value)
+        self.memory.append(self.locations[DR][0], value)
 
     def pop_data(self) -> Q:
-        return self.memory.pop(self.registers[DR])
+        return self.memory.remove(self.locations[DR][0])
 
     def push_call(self, value: Q) -> None:
-        self.memory.push(self.registers[CR], value)
+        self.memory.append(self.locations[CR][0], value)
 
     def pop_call(self) -> Q:
-        return self.memory.pop(self.registers[CR])
+        return self.memory.remove(self.locations[CR][0])
 
-    def step(self) -> None:
-        instruction = self.memory[self.registers[IR]]
-        self.registers[IR] += 1
+    def decode(self, address: Q) -> tuple:
+        decoded = self.decoded.get(address)
 
-        operand, opcode = divmod(instruction, 1)
-        index = fraction_to_index(opcode)
+        if decoded is None:
+            instruction = self.memory[address]
+            operand, opcode = divmod(instruction, 1)
+            operand = int(operand)
+            index = int(fraction_to_index(opcode))
 
-        if index == GET_INDEX:
-            address = self.registers[DR] - 1
-            handle = floor(self.memory[address])
+            if index < len(self.operations):
+                operation = self.operations[index]
+            else:
+                operation = None
+
+            decoded = index, operation, operand
+
+            self.watch_code(address)
+            self.decoded[address] = decoded
+
+        return decoded
+
+    def watch_code(self, address: Q) -> None:
+        if fraction_to_index(address % 1) not in self.memory.watchers:
+            self.memory.watch(address, self.invalidate_decoded)
+
+    def decode_step(self, address: Q) -> tuple:
+        # Like decode, but a superinstruction is decoded as one step, and the
+        # address of the next step is included
+        step = None
+
+        if self.superinstructions is not None:
+            step = self.superinstructions.match(self, address)
+
+        if step is None:
+            index, operation, operand = self.decode(address)
+            step = index, operation, operand, address + 1
+
+        self.steps[address] = step
+        return step
 
-            if not self.streams[handle]:
-                self.registers[IR] -= 1
+    def invalidate_decoded(self, index: int) -> None:
+        self.decoded.clear()
+        self.steps.clear()
+        self.code_version += 1
+
+    def step(self) -> bool:
+        address = self.registers[IR]
+        step = self.steps.get(address)
+
+        if step is None:
+            step = self.decode_step(address)
+
+        index, operation, operand, next_address = step
+        self.registers[IR] = next_address
+
+        if index in READER_INDICES:
+            if self.is_waiting(index):
+                self.registers[IR] = address
+                return False
+        elif index == HCF_INDEX:
+            self.registers[IR] = address
+            return False
+
+        operation(self, operand)
+        return True
+
+    def step_instruction(self) -> bool:
+        # Like step, but runs a single instruction where a superinstruction
+        # would run several
+        address = self.registers[IR]
+        index, operation, operand = self.decode(address)
+
+        if index in READER_INDICES:
+            if self.is_waiting(index):
                 return False
         elif index == HCF_INDEX:
-            self.registers[IR] -= 1
             return False
 
-        operation = INDEX_TO_OPERATION[index]
+        self.registers[IR] = address + 1
         operation(self, operand)
         return True
 
-    def run(self) -> bool:
+    def execute(self) -> None:
+        if self.engine is not None:
+            self.engine.run()
+            return
+
+        if not self.hooks:
+            while self.step():
+                pass
+
+            return
+
+        steps = 0
+
         while self.step():
-            pass
+            steps += 1
+
+            for interval, function in self.hooks:
+                if not steps % interval:
+                    function()
+
+    def every(self, steps: int, function) -> None:
+        # Calls a function after every so many steps of the interpreter. The
+        # block and trace engines run without counting steps.
+        if self.engine_class is not None:
+            raise ValueError('Periodic hooks need the interpreter engine')
+
+        self.hooks.append((steps, function))
+
+    def run(self) -> None:
+        if self.exact:
+            self.execute()
+        else:
+            # Rerun with exact arithmetic if a float result would be inexact
+            snapshot = self.snapshot()
+
+            try:
+                self.execute()
+            except InexactError:
+                self.restore(snapshot)
+                self.make_exact()
+                self.execute()
+
+        if self.sample_interval is not None:
+            self.memory.sample()
+
+    def make_exact(self) -> None:
+        # Floats convert to fractions without rounding
+        self.exact = True
+        self.operations = INDEX_TO_OPERATION
+
+        for register, value in enumerate(self.registers):
+            self.set_register(register, normalize(exact(value)))
+
+        self.memory.convert(lambda value: normalize(exact(value)))
+
+        for stream in self.streams:
+            values = [normalize(exact(value)) for value in stream]
+            stream.clear()
+            stream.extend(values)
+
+        self.invalidate_decoded(None)
+        self.engine = self.engine_class and self.engine_class(self)
+
+    def snapshot(self) -> tuple:
+        return (
+            list(self.registers),
+            self.memory.snapshot(),
+            [deque(stream) for stream in self.streams],
+        )
+
+    def restore(self, snapshot: tuple) -> None:
+        registers, memory, streams = snapshot
+        self.memory.restore(memory)
+
+        for register, value in enumerate(registers):
+            self.set_register(register, value)
+
+        for stream, values in zip(self.streams, streams):
+            stream.clear()
+            stream.extend(values)
+
+        self.invalidate_decoded(None)
+        self.engine = self.engine_class and self.engine_class(self)
+
+    def checkpoint(self, path: str) -> None:
+        checkpoint.save(self, path)
+
+    @classmethod
+    def resume(cls, path: str, **options):
+        # Returns a process in the state saved by checkpoint. The options
+        # are passed to the constructor.
+        state = checkpoint.load(path)
+        process = cls(numeric=state['numeric'], **options)
+        process.restore(
+            (state['registers'], state['memory'], state['streams']))
+
+        # The decoded stacks belong to this process alone
+        process.memory.shared.clear()
+
+        if state['exact'] and not process.exact:
+            process.make_exact()
+
+        return process
+
+    def fork(self):
+        # Returns an independent process in the same state, which shares
+        # the memory stacks copy-on-write
+        process = copy(self)
+        process.registers = list(self.registers)
+        process.locations = list(self.locations)
+        process.memory = self.memory.fork()
+        process.streams = [deque(stream) for stream in self.streams]
+        process.hooks = []
+
+        # The decoded code stays valid as long as the child watches it too
+        process.decoded = dict(self.decoded)
+        process.steps = dict(self.steps)
+
+        for index in self.memory.watchers:
+            process.memory.watchers[index] = process.invalidate_decoded
+
+        if self.memory.collector is not None:
+            process.memory.collector = GarbageCollector(process)
+
+        process.engine = self.engine_class and self.engine_class(process)
+        return process
 
     def read(self, handle: int = STDOUT) -> str:
-        chars = []
         stream = self.streams[handle]
-
-        while stream:
-            char = chr(floor(stream.popleft()))
-            chars.append(char)
-
+        chars = [chr(floor(value)) for value in stream]
+        stream.clear()
         return ''.join(chars)
 
     def write(self, s, handle: int = STDIN) -> None:
-        stream = self.streams[handle]
-
-        for c in s:
-            stream.append(Q(ord(c)))
+        self.streams[handle].extend(map(ord, s))
 
     def print_stack(self, base):
         for offset in range(self.memory.size(base)):
@@ -116,15 +372,25 @@ class Process:
             print(f'{address}: {self.memory[address]}')
 
     def is_halted(self) -> bool:
-        instruction = self.memory[self.registers[IR]]
-        return instruction % 1 == HALT_INDEX
+        index, _, _ = self.decode(self.registers[IR])
+        return index == HCF_INDEX
 
-    def is_blocked(self) -> bool:
-        instruction = self.memory[self.registers[IR]]
+    def is_waiting(self, index: int) -> bool:
+        # Whether a read instruction needs more input than its stream holds.
+        # The stream is on top of the data stack, and the count or delimiter
+        # of a bulk read below it.
+        location = self.locations[DR]
+        stream = self.streams[floor(self.memory.load(location, -1))]
 
-        if instruction % 1 != GET_INDEX:
-            return False
+        if index == GET_INDEX:
+            return not stream
+        elif index == GTI_INDEX:
+            return not has_integer(stream)
+        elif index == GTD_INDEX:
+            return self.memory.load(location, -2) not in stream
+        else:
+            return len(stream) < self.memory.load(location, -2)
 
-        address = self.registers[DR] - 1
-        handle = floor(self.memory[address])
-        return not self.streams[handle]
+    def is_blocked(self) -> bool:
+        index, _, _ = self.decode(self.registers[IR])
+        return index in READER_INDICES and self.is_waiting(index)
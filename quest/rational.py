@@ -0,0 +1,282 @@
+from math import gcd
+import numbers
+import sys
+
+_PyHASH_MODULUS = sys.hash_info.modulus
+_PyHASH_INF = sys.hash_info.inf
+
+# Terms are reduced when either grows past this many bits
+MAX_UNREDUCED_BITS = 256
+
+
+def terms(value) -> tuple:
+    if type(value) is LazyRational:
+        return value._numerator, value._denominator
+
+    return value.numerator, value.denominator
+
+
+class LazyRational:
+    """Rational number that postpones gcd reduction
+
+    Arithmetic keeps the numerator and denominator unreduced, and reduces
+    them only when the terms are read, when the value is hashed or
+    converted to a string, or when a term grows past MAX_UNREDUCED_BITS.
+    Comparisons cross-multiply instead. Integral results are returned as
+    plain ints, as elsewhere in the VM.
+    """
+
+    __slots__ = ('_numerator', '_denominator', '_reduced')
+
+    def __new__(cls, numerator=0, denominator=1):
+        if type(numerator) is int and type(denominator) is int:
+            n, d = numerator, denominator
+        else:
+            n, nd = terms(numerator)
+            dn, d = terms(denominator)
+            n, d = n * d, nd * dn
+
+        if d == 0:
+            raise ZeroDivisionError(f'LazyRational({n}, 0)')
+
+        return cls._create(n, d, False)
+
+    @classmethod
+    def _create(cls, n: int, d: int, reduced: bool):
+        if d < 0:
+            n, d = -n, -d
+
+        if not n % d:
+            return n // d
+
+        if not reduced and (
+                n.bit_length() > MAX_UNREDUCED_BITS or
+                d.bit_length() > MAX_UNREDUCED_BITS):
+            g = gcd(n, d)
+            n, d = n // g, d // g
+            reduced = True
+
+        self = object.__new__(cls)
+        self._numerator = n
+        self._denominator = d
+        self._reduced = reduced
+        return self
+
+    def _reduce(self) -> None:
+        if not self._reduced:
+            g = gcd(self._numerator, self._denominator)
+            self._numerator //= g
+            self._denominator //= g
+            self._reduced = True
+
+    @property
+    def numerator(self) -> int:
+        self._reduce()
+        return self._numerator
+
+    @property
+    def denominator(self) -> int:
+        self._reduce()
+        return self._denominator
+
+    def __repr__(self) -> str:
+        return f'LazyRational({self.numerator}, {self.denominator})'
+
+    def __str__(self) -> str:
+        return f'{self.numerator}/{self.denominator}'
+
+    def __hash__(self) -> int:
+        # Same hash as an equal Fraction
+        self._reduce()
+
+        try:
+            dinv = pow(self._denominator, -1, _PyHASH_MODULUS)
+        except ValueError:
+            hash_ = _PyHASH_INF
+        else:
+            hash_ = hash(hash(abs(self._numerator)) * dinv)
+
+        result = hash_ if self._numerator >= 0 else -hash_
+        return -2 if result == -1 else result
+
+    def __bool__(self) -> bool:
+        return self._numerator != 0
+
+    def __add__(self, other):
+        if type(other) is int:
+            # Adding an integer keeps the terms coprime
+            return LazyRational._create(
+                self._numerator + other * self._denominator,
+                self._denominator, self._reduced)
+
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return LazyRational._create(
+            self._numerator * d + n * self._denominator,
+            self._denominator * d, False)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if type(other) is int:
+            return LazyRational._create(
+                self._numerator - other * self._denominator,
+                self._denominator, self._reduced)
+
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return LazyRational._create(
+            self._numerator * d - n * self._denominator,
+            self._denominator * d, False)
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return LazyRational._create(
+            self._numerator * n, self._denominator * d, False)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        return LazyRational(self, other)
+
+    def __rtruediv__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        return LazyRational(other, self)
+
+    def __floordiv__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return (self._numerator * d) // (self._denominator * n)
+
+    def __rfloordiv__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return (n * self._denominator) // (d * self._numerator)
+
+    def __mod__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+
+        if d == 1:
+            # The remainder modulo an integer keeps the terms coprime
+            return LazyRational._create(
+                self._numerator % (n * self._denominator),
+                self._denominator, self._reduced)
+
+        return LazyRational._create(
+            (self._numerator * d) % (n * self._denominator),
+            self._denominator * d, False)
+
+    def __rmod__(self, other):
+        if not isinstance(other, numbers.Rational):
+            return NotImplemented
+
+        n, d = terms(other)
+        return LazyRational._create(
+            (n * self._denominator) % (self._numerator * d),
+            d * self._denominator, False)
+
+    def __divmod__(self, other):
+        return self // other, self % other
+
+    def __rdivmod__(self, other):
+        return other // self, other % self
+
+    def __pow__(self, other):
+        if type(other) is not int:
+            return NotImplemented
+
+        # Powers of coprime terms are coprime
+        if other < 0:
+            return LazyRational._create(
+                self._denominator ** -other, self._numerator ** -other,
+                self._reduced)
+
+        return LazyRational._create(
+            self._numerator ** other, self._denominator ** other,
+            self._reduced)
+
+    def __neg__(self):
+        return LazyRational._create(
+            -self._numerator, self._denominator, self._reduced)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return LazyRational._create(
+            abs(self._numerator), self._denominator, self._reduced)
+
+    def __floor__(self) -> int:
+        return self._numerator // self._denominator
+
+    def __ceil__(self) -> int:
+        return -(-self._numerator // self._denominator)
+
+    def __trunc__(self) -> int:
+        if self._numerator < 0:
+            return -(-self._numerator // self._denominator)
+
+        return self._numerator // self._denominator
+
+    def __float__(self) -> float:
+        return self._numerator / self._denominator
+
+    def _compare(self, other):
+        # Sign of self - other, or None if other is not rational
+        if type(other) is int:
+            n, d = other, 1
+        elif isinstance(other, numbers.Rational):
+            n, d = terms(other)
+        else:
+            return None
+
+        difference = self._numerator * d - n * self._denominator
+        return (difference > 0) - (difference < 0)
+
+    def __eq__(self, other):
+        sign = self._compare(other)
+        return NotImplemented if sign is None else sign == 0
+
+    def __lt__(self, other):
+        sign = self._compare(other)
+        return NotImplemented if sign is None else sign < 0
+
+    def __le__(self, other):
+        sign = self._compare(other)
+        return NotImplemented if sign is None else sign <= 0
+
+    def __gt__(self, other):
+        sign = self._compare(other)
+        return NotImplemented if sign is None else sign > 0
+
+    def __ge__(self, other):
+        sign = self._compare(other)
+        return NotImplemented if sign is None else sign >= 0
+
+    def __reduce__(self):
+        return LazyRational, (self.numerator, self.denominator)
+
+
+numbers.Rational.register(LazyRational)
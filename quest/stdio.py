@@ -1,7 +1,73 @@
 from enum import Enum
 
+MINUS = ord('-')
+ZERO = ord('0')
+NINE = ord('9')
+WHITESPACE = frozenset(map(ord, ' \t\n\r'))
+
 
 class StandardStream(Enum):
     STDIN = 0 # Standard input
     STDOUT = 1 # Standard output
     STDERR = 2 # Standard error
+
+
+def has_integer(stream) -> bool:
+    # Whether the stream holds whitespace, an optional minus sign and digits,
+    # followed by the character that ends them
+    values = iter(stream)
+    value = next(values, None)
+
+    while value in WHITESPACE:
+        value = next(values, None)
+
+    if value == MINUS:
+        value = next(values, None)
+
+    while value is not None and ZERO <= value <= NINE:
+        value = next(values, None)
+
+    return value is not None
+
+
+def read_values(stream, count: int) -> list:
+    # Reads count values. The caller waits until the stream holds them.
+    return [stream.popleft() for _ in range(count)]
+
+
+def read_until(stream, delimiter) -> list:
+    # Reads the values before the delimiter, and skips the delimiter. The
+    # caller waits until the stream holds the delimiter.
+    values = [stream.popleft() for _ in range(stream.index(delimiter))]
+    stream.popleft()
+    return values
+
+
+def read_integer(stream) -> int:
+    # Skips whitespace, reads an optional minus sign and decimal digits, and
+    # skips the character after them. The caller waits until has_integer.
+    while stream[0] in WHITESPACE:
+        stream.popleft()
+
+    sign = 1
+
+    if stream[0] == MINUS:
+        stream.popleft()
+        sign = -1
+
+    if not ZERO <= stream[0] <= NINE:
+        raise ValueError(f'Not a decimal digit: {stream[0]}')
+
+    value = 0
+
+    while ZERO <= stream[0] <= NINE:
+        value = 10 * value + int(stream.popleft()) - ZERO
+
+    stream.popleft()
+    return sign * value
+
+
+def write_number(stream, value) -> None:
+    # Integers are written in decimal, and other rationals as a numerator
+    # and a denominator separated by a slash
+    stream.extend(map(ord, str(value)))
@@ -0,0 +1,126 @@
+from collections import Counter, deque
+
+from quest.blocks import WRITER_INDICES
+from quest.opcode import Opcode
+from quest.operations import SUPERINSTRUCTIONS, fuse
+from quest.register import Register
+from quest.utils import fraction_to_index
+
+IR = Register.IR.value
+
+INDEX_TO_OPCODE = {
+    fraction_to_index(opcode.value): opcode for opcode in Opcode
+}
+
+# Instructions that can only end a superinstruction
+TERMINATOR_OPCODES = {
+    Opcode.BAL, Opcode.BEQ, Opcode.BGE, Opcode.BGT, Opcode.BLE, Opcode.BLT,
+    Opcode.BNE, Opcode.CLD, Opcode.CLS, Opcode.RET,
+}
+
+# Instructions that are never part of a superinstruction: they block, halt,
+# or read or write the instruction register
+UNFUSABLE_OPCODES = {
+    Opcode.GET, Opcode.GTD, Opcode.GTI, Opcode.GTN, Opcode.HCF, Opcode.LDR,
+    Opcode.STR}
+
+
+def profile(process, max_length: int = 4) -> Counter:
+    """Run a process and count the opcode sequences that it executes
+
+    Only sequences that a superinstruction could replace are counted:
+    straight-line runs of fusable instructions, where a branch, call or
+    return can only come last.
+    """
+
+    registers = process.registers
+    counts = Counter()
+    window = deque(maxlen=max_length)
+
+    while True:
+        address = registers[IR]
+        index, _, _ = process.decode(address)
+
+        if not process.step_instruction():
+            return counts
+
+        opcode = INDEX_TO_OPCODE.get(index)
+
+        if opcode is None or opcode in UNFUSABLE_OPCODES:
+            window.clear()
+            continue
+
+        window.append(opcode)
+        opcodes = tuple(window)
+
+        for length in range(2, len(opcodes) + 1):
+            counts[opcodes[-length:]] += 1
+
+        # Writes to the code can only come last, so that a superinstruction
+        # never runs instructions that it decoded before the write
+        if (opcode in TERMINATOR_OPCODES or index in WRITER_INDICES or
+                registers[IR] != address + 1):
+            window.clear()
+
+
+class SuperinstructionTable:
+    """Opcode sequences that the interpreter runs as single steps
+
+    The table defaults to the built-in superinstructions. A table built from
+    a profile uses the built-in function for a sequence if there is one, and
+    a plain composition of the operations otherwise. Instructions that can
+    write to the code can only end a superinstruction.
+    """
+
+    def __init__(self, superinstructions: dict = SUPERINSTRUCTIONS) -> None:
+        self.superinstructions = dict(superinstructions)
+        self.patterns = {}
+
+        for opcodes, function in self.superinstructions.items():
+            indices = tuple(
+                fraction_to_index(opcode.value) for opcode in opcodes)
+
+            if any(index in WRITER_INDICES for index in indices[:-1]):
+                names = ', '.join(opcode.name.lower() for opcode in opcodes)
+                raise ValueError(f'Writes to code before the end: {names}')
+
+            patterns = self.patterns.setdefault(indices[0], [])
+            patterns.append((indices, function))
+
+        for patterns in self.patterns.values():
+            patterns.sort(key=lambda pattern: len(pattern[0]), reverse=True)
+
+    @classmethod
+    def from_profile(cls, counts: Counter, size: int = 16):
+        # Rank sequences by the number of steps that fusing them would save
+        ranked = sorted(
+            counts.items(), key=lambda item: item[1] * (len(item[0]) - 1),
+            reverse=True)
+
+        superinstructions = {}
+
+        for opcodes, _ in ranked[:size]:
+            superinstructions[opcodes] = (
+                SUPERINSTRUCTIONS.get(opcodes) or fuse(opcodes))
+
+        return cls(superinstructions)
+
+    def match(self, process, address) -> tuple:
+        index, _, _ = process.decode(address)
+
+        for indices, function in self.patterns.get(index, ()):
+            operands = []
+            next_address = address
+
+            for expected_index in indices:
+                index, _, operand = process.decode(next_address)
+
+                if index != expected_index:
+                    break
+
+                operands.append(operand)
+                next_address += 1
+            else:
+                return None, function, tuple(operands), next_address
+
+        return None
@@ -0,0 +1,192 @@
+from fractions import Fraction as Q
+from math import ceil, floor
+
+from quest.codegen import CONDITIONS, INDEX_TO_OPCODE, BlockCompiler
+from quest.numeric import power, power_modulo
+from quest.opcode import Opcode
+from quest.register import Register
+from quest.stdio import (
+    has_integer, read_integer, read_until, read_values, write_number)
+from quest.utils import normalize
+
+IR = Register.IR.value
+DR = Register.DR.value
+CR = Register.CR.value
+
+# Executions of a backward branch target before its loop is traced
+HOT_THRESHOLD = 50
+
+MAX_TRACE_LENGTH = 1000
+
+BACKWARD_BRANCH_OPCODES = {
+    Opcode.BAL, Opcode.BEQ, Opcode.BGE, Opcode.BGT, Opcode.BLE, Opcode.BLT,
+    Opcode.BNE,
+}
+
+# Instructions that end a recording without a trace
+UNTRACEABLE_OPCODES = {Opcode.CLD, Opcode.CLS, Opcode.HCF, Opcode.RET}
+
+
+class TraceCompiler(BlockCompiler):
+    """Compiles one recorded loop iteration to a Python function
+
+    The function repeats the iteration until a guard on a conditional
+    branch fails, and then leaves the failing branch to the interpreter.
+    """
+
+    def __init__(self, trace: list) -> None:
+        super().__init__(None, 0, 0, 0)
+        self.trace = trace
+        self.taken = False
+
+    def emit(self, line: str) -> None:
+        self.lines.append('        ' + line)
+
+    def compile(self) -> str:
+        for offset, opcode, operand, taken in self.trace:
+            self.taken = taken
+            method = getattr(self, 'compile_' + opcode.name.lower())
+            method(offset, operand)
+
+        self.flush()
+
+        lines = [
+            'def trace(process, version):',
+            '    registers = process.registers',
+            '    locations = process.locations',
+            '    memory = process.memory',
+            '    streams = process.streams',
+            '    while True:',
+        ] + self.lines
+
+        return '\n'.join(lines)
+
+    def compile_branch(self, offset: int, operand: int, opcode: Opcode):
+        condition = CONDITIONS[opcode].format(self.pop_value())
+
+        if self.taken:
+            self.exit_if(f'not ({condition})', offset + 1)
+        else:
+            self.exit_if(condition, operand)
+
+    def compile_bal(self, offset: int, operand: int) -> None:
+        pass
+
+
+class TraceEngine:
+    """Runs a process in the interpreter and compiles its hot loops
+
+    Every backward branch counts an execution of its target. When a target
+    gets hot, the next iteration through it is recorded while the
+    interpreter runs it, and compiled to a function that loops on its own
+    until a conditional branch goes the other way. Loops that call or
+    return, or that do not come back to their start within
+    MAX_TRACE_LENGTH instructions, are not traced. Traces are discarded
+    when the code changes.
+    """
+
+    def __init__(self, process) -> None:
+        self.process = process
+        self.version = process.code_version
+        self.counters = {}
+        self.traces = {}
+        self.untraceable = set()
+
+    def record(self, header: Q) -> tuple:
+        # Returns whether the process is still running, and the trace if the
+        # loop could be traced
+        process = self.process
+        registers = process.registers
+        address = header
+        trace = []
+
+        while True:
+            index, _, operand = process.decode(address)
+            opcode = INDEX_TO_OPCODE.get(index)
+
+            if (opcode is None or opcode in UNTRACEABLE_OPCODES or
+                    (opcode is Opcode.STR and operand == IR) or
+                    address.denominator != 1 or
+                    len(trace) == MAX_TRACE_LENGTH):
+                return True, None
+
+            if not process.step_instruction():
+                return False, None
+
+            next_address = registers[IR]
+            trace.append((
+                address.numerator, opcode, operand,
+                next_address != address + 1))
+
+            if process.code_version != self.version:
+                return True, None
+
+            if next_address == header:
+                return True, trace
+
+            address = next_address
+
+    def compile(self, trace: list):
+        compiler = TraceCompiler(trace)
+        source = compiler.compile()
+        namespace = {
+            'Q': Q, 'ceil': ceil, 'floor': floor, 'normalize': normalize,
+            'power': power, 'power_modulo': power_modulo,
+            'has_integer': has_integer, 'read_integer': read_integer,
+            'read_until': read_until, 'read_values': read_values,
+            'write_number': write_number,
+            'IR': IR, 'DR': DR, 'CR': CR,
+        }
+
+        exec(compile(source, '<trace>', 'exec'), namespace)
+        return namespace['trace']
+
+    def run(self) -> None:
+        process = self.process
+        registers = process.registers
+        counters = self.counters
+        traces = self.traces
+
+        while True:
+            if process.code_version != self.version:
+                self.version = process.code_version
+                counters.clear()
+                traces.clear()
+                self.untraceable.clear()
+
+            address = registers[IR]
+            trace = traces.get(address)
+
+            if trace is not None:
+                trace(process, self.version)
+                continue
+
+            index, _, operand = process.decode(address)
+
+            if not process.step():
+                return
+
+            if INDEX_TO_OPCODE.get(index) not in BACKWARD_BRANCH_OPCODES:
+                continue
+
+            target = registers[IR]
+
+            if target >= address or target in self.untraceable:
+                continue
+
+            count = counters.get(target, 0) + 1
+            counters[target] = count
+
+            if count < HOT_THRESHOLD:
+                continue
+
+            del counters[target]
+            running, trace = self.record(target)
+
+            if not running:
+                return
+
+            if trace is None:
+                self.untraceable.add(target)
+            elif process.code_version == self.version:
+                traces[target] = self.compile(trace)
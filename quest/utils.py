@@ -1,4 +1,16 @@
 from fractions import Fraction as Q
+from math import isqrt
+
+from quest.rational import LazyRational
+
+
+def normalize(q: Q):
+    # Integral values are represented as plain ints. Lazy rationals are
+    # never integral, and reading their terms would reduce them.
+    if type(q) is int or type(q) is LazyRational or q.denominator != 1:
+        return q
+
+    return int(q.numerator)
 
 
 def fraction_to_index(q: Q) -> int:
@@ -8,15 +20,19 @@ def fraction_to_index(q: Q) -> int:
     return (den - 1) * (den - 2) // 2 + num
 
 
-def next_fraction(q: Q) -> Q:
-    assert 0 <= q.numerator < q.denominator
-    dq = Q(1, q.denominator)
+def index_to_fraction(index: int) -> tuple:
+    # Inverse of fraction_to_index, as a numerator and denominator. Indices
+    # whose terms have a common factor belong to no stack base.
+    if not index:
+        return 0, 1
+
+    # The smallest denominator whose numerators reach the index
+    den = (isqrt(8 * index) + 3) // 2
 
-    while True:
-        q += dq
+    while den * (den - 1) // 2 < index:
+        den += 1
 
-        if q >= 1:
-            return Q(1, dq.denominator + 1)
+    while (den - 1) * (den - 2) // 2 >= index:
+        den -= 1
 
-        if q.denominator == dq.denominator:
-            return q
+    return index - (den - 1) * (den - 2) // 2, den
@@ -0,0 +1,141 @@
+from fractions import Fraction as Q
+import unittest
+
+from quest.assembler import assemble
+from quest.codegen import compile_module
+from quest.process import Process
+
+ECHO_SOURCE = open('examples/echo.qs').read()
+PART_1_SOURCE = open('examples/advent_of_code_2019/day_01/part_1.qs').read()
+PART_1_INPUT = open('examples/advent_of_code_2019/day_01/input.txt').read()
+PART_1_ANSWER = open('examples/advent_of_code_2019/day_01/answer_1.txt').read()
+
+PART_1_BULK_SOURCE = open(
+    'examples/advent_of_code_2019/day_01/part_1_bulk.qs').read()
+
+
+def load_module(assembly_code):
+    module = {}
+    exec(compile_module(assemble(assembly_code)), module)
+    return module
+
+
+class CodegenTest(unittest.TestCase):
+    def test_halt(self):
+        module = load_module('''
+
+                13, hcf
+
+        ''')
+
+        process = Process(module['MACHINE_CODE'])
+        module['run'](process)
+        self.assertEqual(process.pop_data(), Q(13))
+        self.assertTrue(process.is_halted())
+
+    def test_front_push_pop(self):
+        module = load_module('''
+
+                new
+                1, dup + 1, psh
+                0, dup + 1, psf
+                dup, pof, swp, pof
+                hcf
+
+        ''')
+
+        process = Process(module['MACHINE_CODE'])
+        module['run'](process)
+        self.assertEqual(process.pop_data(), 1)
+        self.assertEqual(process.pop_data(), 0)
+
+    def test_echo(self):
+        module = load_module(ECHO_SOURCE)
+        process = Process(module['MACHINE_CODE'], argv=['hello', 'world'])
+        module['run'](process)
+        self.assertEqual(process.read(), 'hello world\n')
+
+    def test_advent_of_code_2019_day_01_part_1(self):
+        module = load_module(PART_1_SOURCE)
+        process = Process(module['MACHINE_CODE'])
+        process.write(PART_1_INPUT)
+        module['run'](process)
+        self.assertEqual(process.read(), PART_1_ANSWER)
+
+    def test_advent_of_code_2019_day_01_part_1_bulk(self):
+        module = load_module(PART_1_BULK_SOURCE)
+        process = Process(module['MACHINE_CODE'])
+        process.write(PART_1_INPUT)
+        module['run'](process)
+        self.assertEqual(process.read(), PART_1_ANSWER)
+
+    def test_blocked_get(self):
+        module = load_module('''
+
+                ent + 1, 0, stl + 0
+            loop:
+                lds + stdin, get, ldl + 0, add, stl + 0
+                bal + loop
+
+        ''')
+
+        process = Process(module['MACHINE_CODE'])
+        interpreted = Process(module['MACHINE_CODE'])
+
+        for s in ['ab', 'c']:
+            process.write(s)
+            module['run'](process)
+            interpreted.write(s)
+            interpreted.run()
+
+            self.assertTrue(process.is_blocked())
+            self.assertEqual(process.registers, interpreted.registers)
+            self.assertEqual(process.memory.stacks, interpreted.memory.stacks)
+
+    def test_blocked_bulk_get(self):
+        module = load_module('''
+
+                ent + 1, 0, stl + 0
+            loop:
+                lds + stdin, gti, ldl + 0, add, stl + 0
+                new, 2, stdin, gtn, ldl + 0, add, stl + 0
+                new, ';', stdin, gtd, ldl + 0, add, stl + 0
+                bal + loop
+
+        ''')
+
+        process = Process(module['MACHINE_CODE'])
+        interpreted = Process(module['MACHINE_CODE'])
+
+        for s in [' 1', '2\na', 'bc', 'd;', '-3', '4 ']:
+            process.write(s)
+            module['run'](process)
+            interpreted.write(s)
+            interpreted.run()
+
+            self.assertTrue(process.is_blocked())
+            self.assertEqual(process.registers, interpreted.registers)
+            self.assertEqual(process.memory.stacks, interpreted.memory.stacks)
+            self.assertEqual(process.streams, interpreted.streams)
+
+    def test_self_modifying_code(self):
+        module = load_module('''
+
+                cls + function
+                42, sts + function; Overwrite the function's first instruction
+                cls + function
+                hcf
+
+            function:
+                13, ret
+
+        ''')
+
+        process = Process(module['MACHINE_CODE'])
+        module['run'](process)
+        self.assertEqual(process.pop_data(), Q(42))
+        self.assertEqual(process.pop_data(), Q(13))
+
+
+if __name__ == '__main__':
+    unittest.main()
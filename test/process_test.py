@@ -1,11 +1,20 @@
+from array import array
 from fractions import Fraction as Q
+import os
+from tempfile import TemporaryDirectory
 import unittest
 
 from quest.assembler import assemble
+from quest.memory import SparseStack
+from quest.numeric import BACKENDS
 from quest.process import Process
 from quest.register import Register
 from quest.stdio import StandardStream
 
+from codegen_test import load_module
+
+DR = Register.DR.value
+
 STDIN = StandardStream.STDIN.value
 STDOUT = StandardStream.STDOUT.value
 STDERR = StandardStream.STDERR.value
@@ -13,6 +22,21 @@ STDERR = StandardStream.STDERR.value
 ECHO_SOURCE = open('examples/echo.qs').read()
 HELLO_WORLD_SOURCE = open('examples/hello_world.qs').read()
 
+PART_1_BULK_SOURCE = open(
+    'examples/advent_of_code_2019/day_01/part_1_bulk.qs').read()
+PART_1_INPUT = open('examples/advent_of_code_2019/day_01/input.txt').read()
+PART_1_ANSWER = open('examples/advent_of_code_2019/day_01/answer_1.txt').read()
+
+HOT_LOOP_SOURCE = '''
+
+        ent + 1, 100, stl + 0
+    loop:
+        {body}
+        ldl + 0, adi - 1, dup, stl + 0, bne + loop
+        hcf
+
+'''
+
 
 class ProcessTest(unittest.TestCase):
     def test_halt(self):
@@ -25,6 +49,710 @@ class ProcessTest(unittest.TestCase):
         process.run()
         self.assertEqual(process.pop_data(), Q(13))
 
+    def test_store_data_register(self):
+        process = Process(assemble('''
+
+                5, new, str + 1
+                7, 8, ldr + 1, ldd - 1, ldr + 1, ldd - 3
+                hcf
+
+        '''))
+
+        process.run()
+
+        self.assertEqual(process.memory.size(process.registers[DR]), 4)
+        self.assertEqual(process.pop_data(), 7)
+        self.assertEqual(process.pop_data(), 8)
+
+    def test_new_reuses_lowest_base(self):
+        process = Process(assemble('''
+
+                new, new, new, dis
+                swp, del, del
+                new, new
+                hcf
+
+        '''))
+
+        process.run()
+
+        self.assertEqual(process.pop_data(), Q(3, 4))
+        self.assertEqual(process.pop_data(), Q(1, 4))
+
+    def test_garbage_collector(self):
+        process = Process(assemble('''
+
+                ent + 2, new + 1, stl + 0
+                new + 2, ldl + 0, std + 0
+                5000, stl + 1
+            loop:
+                ldl + 1, beq + break
+                new + 4, dis
+                ldl + 1, adi - 1, stl + 1
+                bal + loop
+            break:
+                ldl + 0, hcf
+
+        '''), collect_garbage=True)
+
+        process.run()
+
+        array = process.pop_data()
+        self.assertEqual(process.memory.size(array), 1)
+        self.assertEqual(process.memory.size(process.memory[array]), 2)
+        self.assertGreater(process.memory.collector.collections, 0)
+        self.assertLess(len(process.memory.stacks), 2000)
+
+    def test_garbage_collector_sparse_stack(self):
+        process = Process(assemble('''
+
+                new + 1000000000
+                new + 2, dup + 1, std + 123456789
+                hcf
+
+        '''), collect_garbage=True)
+
+        process.run()
+
+        # Marking visits only the paged-in items of the sparse stack
+        process.memory.collector.collect()
+        sparse = process.pop_data()
+        inner = process.memory[sparse + 123456789]
+        self.assertEqual(process.memory.size(inner), 2)
+
+    def test_compact_stacks(self):
+        process = Process(assemble('''
+
+                new + 3, new + 3
+                7, dup + 2, std + 1
+                1, 2, div, dup + 1, std + 2
+                hcf
+
+        '''))
+
+        process.run()
+
+        memory = process.memory
+        promoted, _ = memory.locate(process.pop_data())
+        compact, _ = memory.locate(process.pop_data())
+
+        self.assertIsInstance(memory.stacks[compact], array)
+        self.assertEqual(list(memory.stacks[compact]), [0, 7, 0])
+        self.assertIsInstance(memory.stacks[promoted], list)
+        self.assertEqual(memory.stacks[promoted], [0, 0, Q(1, 2)])
+
+    def test_new_negative_size(self):
+        process = Process(assemble('''
+
+                new - 1, siz
+                hcf
+
+        '''))
+
+        process.run()
+        self.assertEqual(process.pop_data(), 0)
+
+    def test_sparse_stacks(self):
+        process = Process(assemble('''
+
+                new + 100000, 1, 2, div, dup + 1, std + 99999
+                7, dup + 1, std + 5
+                hcf
+
+        '''))
+
+        process.run()
+
+        memory = process.memory
+        base = process.pop_data()
+        index, _ = memory.locate(base)
+        self.assertIsInstance(memory.stacks[index], SparseStack)
+        self.assertEqual(memory.size(base), 100000)
+        self.assertEqual(memory[base + 5], 7)
+        self.assertEqual(memory[base + 6], 0)
+        self.assertEqual(memory[base - 1], Q(1, 2))
+
+        for offset in range(0, 100000, 4096):
+            memory[base + offset] = offset
+
+        self.assertIsInstance(memory.stacks[index], list)
+        self.assertEqual(memory[base + 4096], 4096)
+        self.assertEqual(memory[base + 5], 7)
+        self.assertEqual(memory[base - 1], Q(1, 2))
+
+    def test_bulk_memory(self):
+        memory = Process().memory
+        base = memory.new()
+
+        memory.extend(base, range(6))
+        self.assertEqual(memory.read_slice(base + 4, 4), [4, 5, 0, 1])
+
+        memory.write_slice(base - 1, [Q(1, 2), 10])
+        self.assertEqual(memory.read_slice(base, 6), [10, 1, 2, 3, 4, Q(1, 2)])
+
+        memory.copy_range(base, base + 1, 3)
+        self.assertEqual(
+            memory.read_slice(base, 6), [10, 10, 1, 2, 4, Q(1, 2)])
+
+    def test_memory_stats(self):
+        process = Process(assemble('''
+
+                new + 5, new + 3, del
+                hcf
+
+        '''), sample_interval=1)
+
+        process.run()
+
+        stats = process.memory.stats(count=1)
+        self.assertEqual(stats['live_stacks'], 5)
+        self.assertEqual(stats['allocations'], 6)
+        self.assertEqual(stats['deletions'], 1)
+        self.assertEqual(stats['free'], 1)
+        self.assertEqual(stats['largest'], [(Q(1, 4), 5, 0)])
+        self.assertEqual(stats['peaks']['live_stacks'], 6)
+        self.assertEqual(stats['peaks']['largest_size'], 5)
+
+    def test_allocation_sites(self):
+        machine_code = assemble('''
+
+                0
+            loop:
+                new + 1, dis
+                adi + 1, dup, adi - 100, bne + loop
+                map, hep
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            sites = set(process.memory.sites.values())
+            self.assertEqual(sites, {1, 7, 8}, engine)
+
+    def test_memory_sampling_needs_interpreter(self):
+        with self.assertRaises(ValueError):
+            Process(engine='blocks', sample_interval=1)
+
+    def test_bulk_opcodes(self):
+        machine_code = assemble('''
+
+                new + 3
+                7, dup + 1, 3, fil
+                new + 3
+                dup + 1, dup + 1, 2, cpy
+                dup + 1, dup + 1, 3, cmp
+                dup + 2, dup + 2, cat
+                dup + 2, siz
+                dup + 3, 2, add, ldd
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            self.assertEqual(process.pop_data(), 7)
+            self.assertEqual(process.pop_data(), 6)
+            self.assertEqual(process.pop_data(), 1)
+
+            base = process.pop_data()
+            self.assertEqual(process.memory.read_slice(base, 3), [7, 7, 0])
+
+    def test_fork(self):
+        process = Process(assemble('''
+
+            loop:
+                stdin, get, stdout, put
+                bal + loop
+
+        '''))
+
+        process.write('Hello')
+        process.run()
+
+        child = process.fork()
+        child.write(', World!')
+        child.run()
+        process.write(', Quest!')
+        process.run()
+
+        self.assertEqual(child.read(), 'Hello, World!')
+        self.assertEqual(process.read(), 'Hello, Quest!')
+
+    def test_fork_copies_stacks_on_write(self):
+        process = Process()
+        base = process.memory.new(3)
+        child = process.fork()
+
+        child.memory[base] = 5
+        process.memory[base + 1] = 7
+
+        self.assertEqual(process.memory.read_slice(base, 3), [0, 7, 0])
+        self.assertEqual(child.memory.read_slice(base, 3), [5, 0, 0])
+
+    def test_snapshot_restore(self):
+        process = Process()
+        base = process.memory.new(2)
+        snapshot = process.snapshot()
+
+        process.memory[base] = 5
+        process.memory.push(base, 9)
+        process.restore(snapshot)
+        self.assertEqual(process.memory.read_slice(base, 2), [0, 0])
+
+        process.memory[base] = 6
+        process.restore(snapshot)
+        self.assertEqual(process.memory.read_slice(base, 2), [0, 0])
+
+    def test_hooks_need_interpreter(self):
+        for engine in ['blocks', 'trace']:
+            process = Process(engine=engine)
+
+            with self.assertRaises(ValueError):
+                process.every(1, process.memory.sample)
+
+    def test_checkpoint_resume(self):
+        process = Process(assemble('''
+
+                1, 3, div, -5, new + 100000, 7, dup + 1, std + 3
+            loop:
+                stdin, get, stdout, put
+                bal + loop
+
+        '''))
+
+        process.write('ab')
+        process.run()
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'process.checkpoint')
+            process.checkpoint(path)
+            resumed = Process.resume(path)
+
+        resumed.write('cd')
+        resumed.run()
+        self.assertEqual(resumed.read(), 'abcd')
+        self.assertEqual(resumed.pop_data(), STDIN)
+
+        base = resumed.pop_data()
+        self.assertEqual(resumed.memory.size(base), 100000)
+        self.assertEqual(resumed.memory[base + 3], 7)
+        self.assertEqual(resumed.pop_data(), -5)
+        self.assertEqual(resumed.pop_data(), Q(1, 3))
+
+    def test_resume_then_allocate(self):
+        process = Process(assemble('''
+
+                new, new, new, new, new, del
+                new, dis
+                del, del, del, del
+                stdin, get
+                new
+                hcf
+
+        '''))
+
+        process.run()
+        self.assertTrue(process.is_blocked())
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'process.checkpoint')
+            process.checkpoint(path)
+            resumed = Process.resume(path)
+
+        resumed.write('a')
+        resumed.run()
+        self.assertTrue(resumed.is_halted())
+
+        base = resumed.pop_data()
+        self.assertEqual(resumed.memory.size(base), 0)
+        self.assertEqual(resumed.pop_data(), ord('a'))
+
+    def test_front_push_pop(self):
+        machine_code = assemble('''
+
+                new
+                1, dup + 1, psh
+                2, dup + 1, psh
+                0, dup + 1, psf
+                dup, pof
+                swp, dup, pof
+                swp, siz
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 0)
+
+    def test_hash_map(self):
+        machine_code = assemble('''
+
+                map
+                10, 1, 2, div, dup + 2, ins
+                20, 3, dup + 2, ins
+                30, 3, dup + 2, ins
+                0, 1, 2, div, dup + 2, lkp
+                -1, 4, dup + 3, lkp
+                3, dup + 3, has
+                3, dup + 4, rem
+                3, dup + 4, has
+                dup + 4, siz
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 0)
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), -1)
+            self.assertEqual(process.pop_data(), 10)
+
+    def test_map_type_errors(self):
+        sources = [
+            'new + 1, 1, 2, dup + 2, ins',
+            'new + 1, 0, 1, dup + 2, lkp',
+            'new + 1, 1, dup + 1, has',
+            'map, 1, 2, dup + 2, ins, dup, ldd',
+            'map, 1, 2, dup + 2, ins, 3, dup + 1, std',
+            'map, 5, dup + 1, psh',
+            'map, 5, dup + 1, psf',
+            'map, new, dup + 1, cat',
+            'map, srt',
+        ]
+
+        for source in sources:
+            process = Process(assemble(source + '\nhcf'))
+
+            with self.assertRaises(TypeError, msg=source):
+                process.run()
+
+    def test_heap(self):
+        machine_code = assemble('''
+
+                hep
+                10, 3, dup + 2, hps
+                20, 1, dup + 2, hps
+                30, 2, dup + 2, hps
+                dup, hpk
+                dup + 2, hpp
+                dup + 4, hpp
+                dup + 6, siz
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 2)
+            self.assertEqual(process.pop_data(), 30)
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 20)
+            self.assertEqual(process.pop_data(), 1)
+            self.assertEqual(process.pop_data(), 20)
+
+    def test_sort_search(self):
+        machine_code = assemble('''
+
+                new
+                3, dup + 1, psh
+                1, 2, div, dup + 1, psh
+                2, dup + 1, psh
+                dup, srt
+                2, dup + 1, sch
+                dup + 1, ldd
+
+                new
+                3, dup + 1, psh, 30, dup + 1, psh
+                1, dup + 1, psh, 10, dup + 1, psh
+                2, dup + 1, psh, 20, dup + 1, psh
+                dup, srt + 2
+                2, dup + 1, sch + 2
+                dup + 1, ldd + 3
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.run()
+
+            self.assertEqual(process.pop_data(), 20)
+            self.assertEqual(process.pop_data(), 2)
+            process.pop_data()
+            self.assertEqual(process.pop_data(), Q(1, 2))
+            self.assertEqual(process.pop_data(), 1)
+
+    def test_sort_search_errors(self):
+        for source in ['new, dup, srt - 1, hcf', 'new, 1, swp, sch - 2, hcf']:
+            for engine in ['interpreter', 'blocks', 'trace']:
+                process = Process(assemble(source), engine=engine)
+
+                with self.assertRaises(ValueError):
+                    process.run()
+
+    def test_bulk_io(self):
+        machine_code = assemble('''
+
+                new
+                dup, 3, stdin, gtn
+                dup + 1, '/', stdin, gtd
+                stdin, gti, stdout, pti
+                dup + 2, stdout, pts
+                dup + 2, 1, add, 2, stdout, ptn
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.write('abcde/-42\n')
+            process.run()
+
+            self.assertEqual(process.read(), '-42abcdebc')
+            self.assertEqual(process.pop_data(), 2)
+            self.assertEqual(process.pop_data(), 3)
+            self.assertEqual(len(process.streams[STDIN]), 0)
+
+    def test_bulk_input_blocks(self):
+        machine_code = assemble('''
+
+                new
+                dup, 3, stdin, gtn
+                dup + 1, '/', stdin, gtd
+                stdin, gti
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+
+            for s in ['ab', 'cde', '/ ', '-4']:
+                process.write(s)
+                process.run()
+                self.assertTrue(process.is_blocked(), engine)
+
+            process.write('2\n')
+            process.run()
+
+            self.assertTrue(process.is_halted(), engine)
+            self.assertEqual(process.pop_data(), -42)
+            self.assertEqual(process.pop_data(), 2)
+            self.assertEqual(process.pop_data(), 3)
+
+    def test_get_integer_errors(self):
+        machine_code = assemble('''
+
+                stdin, gti
+                hcf
+
+        ''')
+
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(machine_code, engine=engine)
+            process.write('\n0\n')
+            process.run()
+            self.assertEqual(process.pop_data(), 0)
+
+            process = Process(machine_code, engine=engine)
+            process.write('x\n')
+
+            with self.assertRaises(ValueError):
+                process.run()
+
+    def test_advent_of_code_2019_day_01_part_1_bulk(self):
+        for engine in ['interpreter', 'blocks', 'trace']:
+            process = Process(assemble(PART_1_BULK_SOURCE), engine=engine)
+            process.write(PART_1_INPUT)
+            process.run()
+            self.assertEqual(process.read(), PART_1_ANSWER, engine)
+
+    def test_extended_arithmetic(self):
+        machine_code = assemble('''
+
+                2, 10, pow
+                2, -2, pow
+                3, 200, 1000, pwm
+                7, 2, div, flr
+                7, 2, div, cel
+                -5, abs
+                3, 4, max
+                3, 4, min
+                -7, 2, div, sgn
+                3, 3, seq
+                3, 4, sne
+                4, 3, slt
+                3, 3, sle
+                hcf
+
+        ''')
+
+        options = [
+            {'engine': 'interpreter'},
+            {'engine': 'blocks'},
+            {'engine': 'trace'},
+            {'numeric': 'lazy'},
+            {'numeric': 'float'},
+        ]
+
+        for kwargs in options:
+            process = Process(machine_code, **kwargs)
+            process.run()
+
+            self.assertEqual(
+                [process.pop_data() for _ in range(13)][::-1],
+                [1024, Q(1, 4), pow(3, 200, 1000), 3, 4, 5, 4, 3, -1, 1, 1,
+                 0, 1])
+
+    def test_modular_power_errors(self):
+        machine_code = assemble('''
+
+                1, 2, div, 3, 5, pwm
+                hcf
+
+        ''')
+
+        options = [
+            {'engine': 'interpreter'},
+            {'engine': 'blocks'},
+            {'engine': 'trace'},
+            {'numeric': 'float'},
+        ]
+
+        for kwargs in options:
+            process = Process(machine_code, **kwargs)
+
+            with self.assertRaises(ValueError):
+                process.run()
+
+    def test_heap_type_errors(self):
+        sources = [
+            'new + 1, 1, 2, dup + 2, hps',
+            'new + 1, 5, dup + 1, psh, hpp',
+            'hep, 1, 2, dup + 2, hps, ldd',
+            'hep, 1, 2, dup + 2, hps, 3, dup + 1, std',
+            'hep, 1, 2, dup + 2, hps, pop',
+            'hep, 5, dup + 1, psh',
+            'hep, 1, 2, dup + 2, hps, srt',
+            'hep, 1, 2, dup + 2, hps, dup, sch',
+            'new, hep, 1, 2, dup + 2, hps, cat',
+            'map, 1, 2, dup + 2, hps',
+        ]
+
+        for source in sources:
+            process = Process(assemble(source + '\nhcf'))
+
+            with self.assertRaises(TypeError, msg=source):
+                process.run()
+
+    def test_integral_values_are_ints(self):
+        process = Process(assemble('''
+
+                1, 3, div, dup, 3, mul
+                1, 2, div, dup, add
+                hcf
+
+        '''), numeric='fraction')
+
+        process.run()
+
+        value = process.pop_data()
+        self.assertEqual(value, 1)
+        self.assertIs(type(value), int)
+
+        value = process.pop_data()
+        self.assertEqual(value, 1)
+        self.assertIs(type(value), int)
+
+        value = process.pop_data()
+        self.assertEqual(value, Q(1, 3))
+        self.assertIs(type(value), Q)
+
+    @unittest.skipUnless('gmpy2' in BACKENDS, 'gmpy2 is not installed')
+    def test_gmpy2_backend(self):
+        process = Process(assemble('''
+
+                1, 3, div, 1, 6, div, add
+                hcf
+
+        '''), numeric='gmpy2')
+
+        process.run()
+
+        value = process.pop_data()
+        self.assertEqual(value, Q(1, 2))
+        self.assertIs(type(value), BACKENDS['gmpy2'])
+
+    def test_lazy_backend(self):
+        process = Process(assemble('''
+
+                1, 3, div, 1, 6, div, add
+                1, 2, div, 1, 2, div, add
+                hcf
+
+        '''), numeric='lazy')
+
+        process.run()
+
+        value = process.pop_data()
+        self.assertEqual(value, 1)
+        self.assertIs(type(value), int)
+
+        value = process.pop_data()
+        self.assertEqual(value, Q(1, 2))
+        self.assertEqual(hash(value), hash(Q(1, 2)))
+        self.assertEqual(str(value), '1/2')
+
+    def test_float_backend(self):
+        process = Process(assemble('''
+
+                3, 4, div, 1, 8, div, add
+                hcf
+
+        '''), numeric='float')
+
+        process.run()
+
+        value = process.pop_data()
+        self.assertEqual(value, 0.875)
+        self.assertIs(type(value), float)
+        self.assertFalse(process.exact)
+
+    def test_float_backend_fallback(self):
+        process = Process(assemble('''
+
+                'a', stdout, put
+                1, 2, div, 1, 3, div, add
+                'b', stdout, put
+                hcf
+
+        '''), numeric='float')
+
+        process.run()
+
+        value = process.pop_data()
+        self.assertEqual(value, Q(5, 6))
+        self.assertIs(type(value), Q)
+        self.assertTrue(process.exact)
+        self.assertEqual(process.read(), 'ab')
+
     def test_call(self):
         process = Process(assemble('''
 
@@ -39,6 +767,128 @@ class ProcessTest(unittest.TestCase):
         process.run()
         self.assertEqual(process.pop_data(), Q(13))
 
+    def test_self_modifying_code(self):
+        process = Process(assemble('''
+
+                cls + function
+                42, sts + function; Overwrite the function's first instruction
+                cls + function
+                hcf
+
+            function:
+                13, ret
+
+        '''))
+
+        process.run()
+        self.assertEqual(process.pop_data(), Q(42))
+        self.assertEqual(process.pop_data(), Q(13))
+        self.assertTrue(process.is_halted())
+
+    def test_self_modifying_code_blocks(self):
+        process = Process(assemble('''
+
+                cls + function
+                42, sts + function; Overwrite the function's first instruction
+                cls + function
+                hcf
+
+            function:
+                13, ret
+
+        '''), engine='blocks')
+
+        process.run()
+        self.assertEqual(process.pop_data(), Q(42))
+        self.assertEqual(process.pop_data(), Q(13))
+        self.assertTrue(process.is_halted())
+
+    def test_hot_loop_trace(self):
+        process = Process(assemble('''
+
+                ent + 2, 0, stl + 0, 200, stl + 1
+            loop:
+                ldl + 1, beq + break
+                ldl + 0, ldl + 1, add, stl + 0
+                ldl + 1, adi - 1, stl + 1
+                bal + loop
+            break:
+                ldl + 0, hcf
+
+        '''), engine='trace')
+
+        process.run()
+        self.assertEqual(process.pop_data(), Q(20100))
+        self.assertTrue(process.is_halted())
+        self.assertEqual(len(process.engine.traces), 1)
+
+    def assert_hot_loop(self, body):
+        # Runs the body in a loop that gets traced, and compares the block
+        # and trace engines and the questc output with the interpreter
+        module = load_module(HOT_LOOP_SOURCE.format(body=body))
+        machine_code = module['MACHINE_CODE']
+        interpreted = Process(machine_code)
+        interpreted.run()
+        output = interpreted.read()
+
+        for engine in ['blocks', 'trace', 'questc']:
+            if engine == 'questc':
+                process = Process(machine_code)
+                module['run'](process)
+            else:
+                process = Process(machine_code, engine=engine)
+                process.run()
+
+            if engine == 'trace':
+                self.assertEqual(len(process.engine.traces), 1)
+
+            self.assertEqual(process.registers, interpreted.registers, engine)
+            self.assertEqual(
+                process.memory.stacks, interpreted.memory.stacks, engine)
+            self.assertEqual(process.read(), output, engine)
+
+    def test_hot_loop_search(self):
+        self.assert_hot_loop('1, 2, 3, 2, ldr + dr, sch')
+
+    def test_hot_loop_bulk(self):
+        self.assert_hot_loop(
+            '1, 2, ldr + dr, adi - 2, ldr + dr, adi - 1, 1, cmp')
+        self.assert_hot_loop(
+            '1, 2, 0, 0, ldr + dr, adi - 4, ldr + dr, adi - 3, 2, cpy')
+        self.assert_hot_loop('0, 0, 7, ldr + dr, adi - 3, 2, fil')
+        self.assert_hot_loop('1, 2, new, ldr + dr, cat')
+
+    def test_hot_loop_output(self):
+        self.assert_hot_loop('72, 105, ldr + dr, stdout, pts')
+        self.assert_hot_loop('72, 105, ldr + dr, adi - 2, 2, stdout, ptn')
+
+    def test_hot_loop_input(self):
+        source = HOT_LOOP_SOURCE.format(body='stdin, gti, dis')
+        interpreted = Process(assemble(source))
+        interpreted.write(99 * '7\n')
+        interpreted.run()
+
+        process = Process(assemble(source), engine='trace')
+        process.write(99 * '7\n')
+        process.run()
+
+        self.assertTrue(process.is_blocked())
+        self.assertEqual(process.registers, interpreted.registers)
+        self.assertEqual(process.memory.stacks, interpreted.memory.stacks)
+        self.assertEqual(len(process.engine.traces), 1)
+
+        process.write('7\n')
+        process.run()
+        self.assertTrue(process.is_halted())
+
+    def test_hot_loop_map(self):
+        self.assert_hot_loop('map, 3, dup + 1, has')
+        self.assert_hot_loop('map, 7, 3, dup + 2, ins, 0, 3, dup + 2, lkp')
+
+    def test_hot_loop_heap(self):
+        self.assert_hot_loop('hep, 7, 3, dup + 2, hps, dup, hpk')
+        self.assert_hot_loop('hep, 7, 3, dup + 2, hps, dup, hpp')
+
     def test_hello_world(self):
         process = Process(assemble(HELLO_WORLD_SOURCE))
         process.run()
@@ -77,6 +927,13 @@ class ProcessTest(unittest.TestCase):
         process.run()
         self.assertEqual(process.read(), 'hello world\n')
 
+    def test_echo_blocks(self):
+        process = Process(
+            assemble(ECHO_SOURCE), argv=['hello', 'world'], engine='blocks')
+
+        process.run()
+        self.assertEqual(process.read(), 'hello world\n')
+
     def test_get_integer_line(self):
         process = Process(assemble('''
 
@@ -0,0 +1,126 @@
+import unittest
+
+from quest.assembler import assemble
+from quest.opcode import Opcode
+from quest.process import Process
+from quest.operations import fuse
+from quest.superinstructions import SuperinstructionTable, profile
+
+PART_1_SOURCE = open('examples/advent_of_code_2019/day_01/part_1.qs').read()
+PART_1_INPUT = open('examples/advent_of_code_2019/day_01/input.txt').read()
+PART_1_ANSWER = open('examples/advent_of_code_2019/day_01/answer_1.txt').read()
+
+
+def run_counting_steps(process):
+    steps = 0
+
+    while process.step():
+        steps += 1
+
+    return steps
+
+
+class SuperinstructionsTest(unittest.TestCase):
+    def test_builtin_table(self):
+        machine_code = assemble(PART_1_SOURCE)
+
+        process = Process(machine_code)
+        process.write(PART_1_INPUT)
+        steps = run_counting_steps(process)
+
+        fused_process = Process(
+            machine_code, superinstructions=SuperinstructionTable())
+
+        fused_process.write(PART_1_INPUT)
+        fused_steps = run_counting_steps(fused_process)
+
+        self.assertEqual(fused_process.read(), PART_1_ANSWER)
+        self.assertEqual(fused_process.registers, process.registers)
+        self.assertLess(fused_steps, steps)
+
+    def test_profile(self):
+        machine_code = assemble(PART_1_SOURCE)
+
+        process = Process(machine_code)
+        process.write(PART_1_INPUT)
+        counts = profile(process)
+
+        self.assertEqual(process.read(), PART_1_ANSWER)
+        self.assertGreater(counts[(Opcode.DUP, Opcode.ADI, Opcode.BEQ)], 0)
+        self.assertEqual(counts[(Opcode.GET, Opcode.DUP)], 0)
+
+        superinstructions = SuperinstructionTable.from_profile(counts)
+        fused_process = Process(
+            machine_code, superinstructions=superinstructions)
+
+        fused_process.write(PART_1_INPUT)
+        fused_steps = run_counting_steps(fused_process)
+
+        process = Process(machine_code)
+        process.write(PART_1_INPUT)
+        steps = run_counting_steps(process)
+
+        self.assertEqual(fused_process.read(), PART_1_ANSWER)
+        self.assertLess(fused_steps, steps * 3 // 4)
+
+    def test_trace_engine(self):
+        machine_code = assemble(PART_1_SOURCE)
+
+        process = Process(
+            machine_code, engine='trace',
+            superinstructions=SuperinstructionTable())
+
+        process.write(PART_1_INPUT)
+        process.run()
+
+        self.assertEqual(process.read(), PART_1_ANSWER)
+        self.assertTrue(process.engine.traces)
+
+    def test_profile_with_superinstructions(self):
+        machine_code = assemble(PART_1_SOURCE)
+
+        process = Process(machine_code)
+        process.write(PART_1_INPUT)
+        counts = profile(process)
+
+        fused_process = Process(
+            machine_code, superinstructions=SuperinstructionTable())
+
+        fused_process.write(PART_1_INPUT)
+        self.assertEqual(profile(fused_process), counts)
+        self.assertEqual(fused_process.read(), PART_1_ANSWER)
+
+    def test_self_modifying_code(self):
+        machine_code = assemble('''
+
+                7, sts + target
+            target:
+                13, hcf
+
+        ''')
+
+        with self.assertRaises(ValueError):
+            opcodes = Opcode.LDI, Opcode.STS, Opcode.LDI
+            SuperinstructionTable({opcodes: fuse(opcodes)})
+
+        process = Process(machine_code)
+        process.run()
+
+        opcodes = Opcode.LDI, Opcode.STS
+        fused_process = Process(
+            machine_code,
+            superinstructions=SuperinstructionTable({opcodes: fuse(opcodes)}))
+
+        fused_process.run()
+        self.assertEqual(fused_process.memory.stacks, process.memory.stacks)
+        self.assertEqual(fused_process.pop_data(), 7)
+
+        profiled_process = Process(machine_code)
+        counts = profile(profiled_process)
+        self.assertEqual(counts[(Opcode.LDI, Opcode.STS)], 1)
+        self.assertEqual(counts[(Opcode.LDI, Opcode.STS, Opcode.LDI)], 0)
+        SuperinstructionTable.from_profile(counts)
+
+
+if __name__ == '__main__':
+    unittest.main()